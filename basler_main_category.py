@@ -1,18 +1,40 @@
+import argparse
+import asyncio
 import math
 import pymysql
-import requests, os, gzip, hashlib, json
+import requests, os, gzip, hashlib, json, time
 from lxml import html
-from sql_queries import main_cat_query, sub_cat_query, products_query
+from urllib.parse import urlsplit
+from category_tree import CategoryTree
+from crawl_engine import AsyncFetcher
+from crawl_frontier import CrawlFrontier
+from crawl_metrics import configure_logging, logger, metrics
+from crawl_state import CategoryIdStore, CategoryStateStore, page_hash
+from db_writer import ProductLinkWriter, create_tables
+from http_client import configure_http, send_request
+from response_cache import SQLiteResponseCache, configure_cache, get_cache
+
+# Saved pages / response cache of the crawler and of the product detail stage
+project_name = 'Basler_Web'
+PROJECT_FILES_DIR = f'C:\\Project Files\\{project_name}_Project_Files'
+DEFAULT_PAGE_SIZE = 21  # Page size of the website's own product listing, always accepted by the magento API
+DEFAULT_LOCALES = {'en-us': 'amer_en'}  # Website locale -> magento store code
+MAGENTO_PAGE_SIZE_FILTER = ',%22page_size%22:%5B%22-PAGE_SIZE-%22%5D'  # URL encoded ,"page_size":["-PAGE_SIZE-"] of the filters
+EXCLUDED_MAIN_CATEGORY_WORDS = {'kits', 'bundles', 'software'}  # Main categories without magento product listings
 
 
 def req_sender(url: str, method: str, query_dict: dict = None, cookies: dict = None, headers: dict = None) -> bytes or None:
     # Prepare headers for the HTTP request
 
-    # Send HTTP request
-    _response = requests.request(method=method, url=url, data=query_dict, cookies=cookies, headers=headers)
-    # Check if response is successful
-    if _response.status_code != 200:
-        print(f"HTTP Status code: {_response.status_code}")  # Print status code if not 200
+    # Send HTTP request through the shared pooled session (retries with backoff happen inside the session)
+    try:
+        _response = send_request(method=method, url=url, data=query_dict, cookies=cookies, headers=headers)
+    except requests.RequestException as e:
+        logger.warning('Request failed for %s: %s', url, e)  # Connection errors / timeouts left after all retries
+        return None
+    # Check if response is successful (304 only comes back for conditional requests and is handled by the caller)
+    if _response.status_code not in (200, 304):
+        logger.warning('HTTP Status code: %s for %s', _response.status_code, url)  # Log status code if not 200
         return None
     return _response  # Return the response if successful
 
@@ -20,315 +42,565 @@ def req_sender(url: str, method: str, query_dict: dict = None, cookies: dict = N
 def ensure_dir_exists(dir_path: str):
     # Check if directory exists, if not, create it
     if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
-        print(f'Directory {dir_path} Created')  # Print confirmation of directory creation
+        os.makedirs(dir_path, exist_ok=True)  # exist_ok as fetcher threads may race on the same directory
+        logger.info('Directory %s Created', dir_path)  # Log confirmation of directory creation
+
+
+def legacy_cached_body(file_path: str) -> bytes or None:
+    # Reads a response saved by the old file-per-URL cache, so existing crawls are imported into the cache store
+    if not os.path.exists(file_path):
+        return None
+    if file_path.endswith('.gz'):
+        with gzip.open(filename=file_path, mode='rb') as file:
+            return file.read()
+    with open(file_path, 'rb') as file:
+        return file.read()
+
+
+def cached_request(url: str, method: str, directory_path: str, page_hash: str, legacy_file_name: str, revalidate: bool = False, headers: dict = None,
+                   decode=None, **request_kwargs):
+    # Looks the request up in the response cache and only sends it when the entry is missing or stale (or revalidate is asked)
+    # A replaying cache never sends anything: stored entries are served as they are and missing ones count as failed requests
+    # decode(body) builds the returned value and raises ValueError for unusable bodies (e.g. an HTML maintenance page instead of JSON):
+    # those are never cached, and a stored one is dropped and fetched again
+    decode = decode or (lambda body: body)
+    namespace = os.path.basename(directory_path)  # Old cache directory name, e.g. 'Product_Pages'
+    cache = get_cache(directory_path=directory_path)
+    replay = getattr(cache, 'replay', False)
+    entry = cache.get(namespace=namespace, key=page_hash)
+    decoded = None
+    if entry is not None:
+        try:
+            decoded = decode(entry['body'])
+        except ValueError:
+            logger.warning('Dropping unusable cached response %s/%s of %s', namespace, page_hash, url)
+            if not replay:  # A replayed archive is never changed
+                cache.delete(namespace=namespace, key=page_hash)
+            entry = None
+    if entry is not None and entry['fresh'] and (replay or not revalidate):
+        logger.debug('Cache hit %s/%s', namespace, page_hash)
+        metrics.record_cache(stage=namespace, hit=True)
+        return decoded
+    if entry is None:
+        legacy_body = legacy_cached_body(file_path=os.path.join(directory_path, legacy_file_name))
+        if legacy_body is not None:
+            try:
+                legacy_decoded = decode(legacy_body)
+            except ValueError:
+                logger.warning('Ignoring unusable legacy cache file %s/%s', namespace, legacy_file_name)
+            else:
+                logger.debug('Importing %s/%s into the cache', namespace, legacy_file_name)
+                metrics.record_cache(stage=namespace, hit=True)
+                cache.put(namespace=namespace, key=page_hash, url=url, body=legacy_body)
+                return legacy_decoded
+    if replay:
+        logger.warning('Not in the archive, skipped in replay: %s', url)
+        metrics.record_cache(stage=namespace, hit=False)
+        return None
+    logger.debug('Cache miss %s/%s, Sending request...', namespace, page_hash)  # Notify that a request will be sent
+    metrics.record_cache(stage=namespace, hit=False)
+    headers = dict(headers or dict())
+    if entry is not None:  # Conditional request, so an unchanged response costs a 304 without a body
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    request_started = time.monotonic()
+    _response = req_sender(url=url, method=method, headers=headers or None, **request_kwargs)  # Send the HTTP request
+    metrics.record_request(stage=namespace, seconds=time.monotonic() - request_started, size=len(_response.content) if _response is not None else 0)
+    if _response is None:
+        if entry is not None:
+            logger.warning('Serving stale %s/%s', namespace, page_hash)  # Refetch failed, the stored copy is better than nothing
+            return decoded
+        return None
+    if _response.status_code == 304 and entry is not None:
+        logger.debug('Not modified %s/%s', namespace, page_hash)
+        cache.touch(namespace=namespace, key=page_hash)
+        return decoded
+    try:
+        fetched = decode(_response.content)
+    except ValueError:
+        logger.warning('Unusable response from %s, not cached', url)
+        return decoded  # The stored copy if there is one, like a failed refetch
+    cache.put(namespace=namespace, key=page_hash, url=url, body=_response.content, content_type=_response.headers.get('Content-Type'),
+              etag=_response.headers.get('ETag'), last_modified=_response.headers.get('Last-Modified'))
+    return fetched
 
 
 def page_checker(url: str, method: str, directory_path: str, query_dict: dict = None):
-    # Create a unique hash for the URL to use as the filename
+    # Create a unique hash for the URL to use as the cache key
     page_hash = hashlib.sha256(string=url.encode(encoding='UTF-8', errors='backslashreplace')).hexdigest()
-    ensure_dir_exists(dir_path=directory_path)  # Ensure the directory exists
-    file_path = os.path.join(directory_path, f"{page_hash}.html.gz")  # Define file path
-    if os.path.exists(file_path):  # Check if the file already exists
-        print("File exists, reading it...")  # Notify that the file is being read
-        print(f"Filename is {page_hash}")
-        with gzip.open(filename=file_path, mode='rb') as file:
-            file_text = file.read().decode(encoding='UTF-8', errors='backslashreplace')  # Read and decode file
-        return file_text  # Return the content of the file
-    else:
-        print("File does not exist, Sending request & creating it...")  # Notify that a request will be sent
-        _response = req_sender(url=url, method=method, query_dict=query_dict)  # Send the HTTP request
-        if _response is not None:
-            print(f"Filename is {page_hash}")
-            with gzip.open(filename=file_path, mode='wb') as file:
-                if isinstance(_response, str):
-                    file.write(_response.encode())  # Write response if it is a string
-                    return _response
-                file.write(_response.content)  # Write response content if it is bytes
-            return _response.text  # Return the response text
-
-
-def page_checker_json(url: str, method: str, directory_path: str, cookies: dict = None, headers: dict = None, query_dict: dict = None):
-    # Create a unique hash for the URL and data to use as the filename
+    body = cached_request(url=url, method=method, directory_path=directory_path, page_hash=page_hash, legacy_file_name=f"{page_hash}.html.gz", query_dict=query_dict)
+    if body is not None:
+        return body.decode(encoding='UTF-8', errors='backslashreplace')  # Return the page text
+
+
+def json_like_body(body: bytes) -> bytes:
+    # Cheap check for raw bodies that are parsed later in worker processes, rejects the HTML error pages served with status 200
+    if body.lstrip()[:1] not in (b'{', b'['):
+        raise ValueError('Not a JSON body')
+    return body
+
+
+def page_checker_json(url: str, method: str, directory_path: str, cookies: dict = None, headers: dict = None, query_dict: dict = None, revalidate: bool = False, raw: bool = False):
+    # Create a unique hash for the URL and data to use as the cache key
     hash_input = url + json.dumps(query_dict, sort_keys=True)  # Combine URL and data for hashing
     page_hash = hashlib.sha256(hash_input.encode('UTF-8')).hexdigest()
-    ensure_dir_exists(dir_path=directory_path)  # Ensure the directory exists
-    file_path = os.path.join(directory_path, f"{page_hash}.json")  # Define file path
-
-    if os.path.exists(file_path):  # Check if the file already exists
-        print("File exists, reading it...")  # Notify that the file is being read
-        print(f"Filename is {page_hash}")
-        with open(file_path, 'r', encoding='UTF-8') as file:
-            file_text = file.read()  # Read the file
-        return json.loads(file_text)  # Return the content as a dictionary
-
-    else:
-        print("File does not exist, Sending request & creating it...")  # Notify that a request will be sent
-        _response = req_sender(url=url, method=method, query_dict=query_dict, cookies=cookies, headers=headers)  # Send the GET request
-        if _response is not None:
-            response_json = _response.json()  # Get the JSON response
-            print(f"Filename is {page_hash}")
-            with open(file_path, 'w', encoding='UTF-8') as file:
-                json.dump(response_json, file, ensure_ascii=False, indent=4)  # Write JSON response to file
-            return response_json  # Return the JSON response as a dictionary
+    # Only bodies that decode are cached, raw returns the undecoded body for callers that parse it elsewhere (e.g. in a worker process)
+    return cached_request(url=url, method=method, directory_path=directory_path, page_hash=page_hash, legacy_file_name=f"{page_hash}.json", revalidate=revalidate,
+                          decode=json_like_body if raw else json.loads, query_dict=query_dict, cookies=cookies, headers=headers)
+
+
+def category_slug(prod_cat_link: str, locale: str = 'en-us') -> str:
+    # Converts a product category link into the slug expected by the contentful API
+    slug = prod_cat_link.split(f'/{locale}/')[1]
+    if slug.endswith('/'):
+        return slug[:-1]
+    if '#products' in slug:
+        return slug.replace('/?', '&').replace('/#products', '').replace('#products', '')
+    return slug
+
+
+def link_slug_words(link: str) -> set:
+    # Words of the last path segment of a nav link, e.g. '/en-us/products/kits-and-bundles/' -> {'kits', 'and', 'bundles'}
+    # Used instead of the link text, which is translated in every locale
+    path = urlsplit(link).path.rstrip('/')
+    return set(path.rsplit('/', 1)[-1].lower().split('-'))
+
+
+def category_ids_from_contentful(cat_id_response: dict) -> list:
+    # Collects the magento category ids from the staticFilters of the linked entries
+    category_ids = list()
+    linked_entries = (cat_id_response.get('entry') or dict()).get('linkedEntries') or dict()
+    for linked_entry in linked_entries.values():
+        static_filters = (linked_entry.get('fields') or dict()).get('staticFilters')
+        if static_filters is not None and static_filters.get('category_id'):
+            category_id = static_filters.get('category_id')[0]
+            if category_id not in category_ids:
+                category_ids.append(category_id)
+    return category_ids
+
+
+def magento_page_url(template: str, category_id: str, page_no: int, page_size: int = DEFAULT_PAGE_SIZE) -> str:
+    # The default page size is what the API uses without a page_size filter, leaving it out keeps the URL (and cache key) of the older crawls
+    if page_size == DEFAULT_PAGE_SIZE:
+        template = template.replace(MAGENTO_PAGE_SIZE_FILTER, '')
+    return template.replace("-PAGE_NO-", f'{page_no}').replace('-PAGE_SIZE-', f'{page_size}').replace('-C_I_D-', category_id)
+
+
+def pagination_problem(pages: list, total_count: int, page_size: int) -> str or None:
+    # Why the fetched pages do not add up to one consistent listing (the catalog changed mid-crawl), None when they do
+    for page_index, page_response in enumerate(pages):
+        if page_response is None:
+            continue  # Failed request, handled by the frontier retry
+        if page_response.get('total_count') != total_count:
+            return f'total_count changed from {total_count} to {page_response.get("total_count")} on page {page_index + 1}'
+        expected_items = min(page_size, total_count - page_index * page_size)
+        if len(page_response.get('items') or list()) != expected_items:
+            return f'page {page_index + 1} has {len(page_response.get("items") or list())} items instead of {expected_items}'
+    return None
 
 
 class Scraper:
-    def __init__(self):
-        # Connecting to the Database
-        connection = pymysql.connect(host='localhost', user='root', database='baslerweb_db', password='actowiz', charset='utf8mb4', autocommit=True)
+    def __init__(self, base_url: str = 'https://www.baslerweb.com', max_per_host: int = 8, max_workers: int = 32, requests_per_second: float = 0, batch_size: int = 500,
+                 cache_ttl: float = None, cache_max_bytes: int = None, revalidate: bool = False, incremental: bool = False,
+                 worker_id: str = None, resume: bool = True, claim_batch_size: int = 16, category_id_max_age: float = 7 * 24 * 3600,
+                 max_page_size: int = 500, max_replans: int = 2, replay: bool = False, locales: dict = None,
+                 log_level: str = 'INFO', metrics_path: str = None, metrics_format: str = 'json', connection=None, project_files_dir: str = PROJECT_FILES_DIR):
+        # Logging level DEBUG prints every request / nav entry, INFO and above skip the per-row output
+        configure_logging(level=log_level)
+        self.metrics_path = metrics_path
+        self.metrics_format = metrics_format  # 'json' or 'prometheus' summary at the end of scrape()
+
+        # Connecting to the Database (an already open connection can be passed in, e.g. to a benchmark database)
+        if connection is None:
+            connection = pymysql.connect(host='localhost', user='root', database='baslerweb_db', password='actowiz', charset='utf8mb4', autocommit=True)
         if connection.open:
-            print('Database connection Successful!')
+            logger.info('Database connection Successful!')
         else:
-            print('Database connection Un-Successful.')
+            logger.error('Database connection Un-Successful.')
+        self.connection = connection
         self.cursor = connection.cursor()
 
-        # Creating Table in Database If Not Exists
-        try:
-            self.cursor.execute(query=main_cat_query)
-        except Exception as e:
-            print(e)
-        try:
-            self.cursor.execute(query=sub_cat_query)
-        except Exception as e:
-            print(e)
-        try:
-            self.cursor.execute(query=products_query)
-        except Exception as e:
-            print(e)
+        # Creating Tables in Database If Not Exists
+        create_tables(cursor=self.cursor)
 
         # Creating Saved Pages Directory if not Exists
-        project_name = 'Basler_Web'
-
-        self.project_files_dir = f'C:\\Project Files\\{project_name}_Project_Files'
+        self.project_files_dir = project_files_dir
         ensure_dir_exists(dir_path=self.project_files_dir)
 
-        self.main_page_url = 'https://www.baslerweb.com/en-us/'
+        # All saved responses (main page, category id jsons, product pages) live in one compressed, deduplicated archive
+        # replay re-runs the crawl from that archive only, without sending a single request
+        self.cache = configure_cache(SQLiteResponseCache(db_path=os.path.join(self.project_files_dir, 'response_cache.sqlite3'), ttl=cache_ttl, max_bytes=cache_max_bytes,
+                                                         revalidate=revalidate, replay=replay))
 
-    def scrape(self):
-        main_page_text = page_checker(url=self.main_page_url, method='GET', directory_path=os.path.join(self.project_files_dir, 'Main_Page'))
-        parsed_html = html.fromstring(main_page_text)  # Parsing the main page response text
+        # One set of urls per locale ({locale: magento store}), all locales are crawled together through the same fetcher, frontier and writer
+        self.base_url = base_url.rstrip('/')
+        self.locales = dict(locales or DEFAULT_LOCALES)
+        self.main_page_urls = {locale: f'{self.base_url}/{locale}/' for locale in self.locales}
+        self.contentful_url_templates = {locale: self.base_url + f'/api/contentful?slug=-SLUG-&locale={locale}' for locale in self.locales}
+        self.product_cat_link_templates = {locale: self.base_url + f'/api/magento/products?store={store}&locale={locale}&filters=%7B%22sort_dir%22:%5B%22asc%22%5D,%22page%22:%5B%22-PAGE_NO-%22%5D' + MAGENTO_PAGE_SIZE_FILTER + ',%22category_id%22:%5B%22-C_I_D-%22%5D%7D'
+                                           for locale, store in self.locales.items()}
+
+        # Magento pages are requested as large as the API allows: max_page_size until a response shows a lower server cap
+        self.page_size = max(max_page_size, DEFAULT_PAGE_SIZE)
+        self.max_replans = max_replans  # Re-fetches of a category whose pages disagree before it is left to the frontier retry
+
+        # Fetch engine used for the contentful and magento API calls
+        self.max_per_host = max_per_host
+        self.max_workers = max_workers
+        configure_http(pool_maxsize=max_workers, requests_per_second=requests_per_second)  # One connection pool slot per fetcher thread
+
+        # Buffered writer for products_links, flushed per category and on shutdown
+        self.writer = ProductLinkWriter(connection=self.connection, batch_size=batch_size)
+        self.category_tree = CategoryTree(connection=self.connection)
+
+        # Incremental mode revalidates magento pages and only rewrites the pages whose content changed
+        self.incremental = incremental
+        self.category_states = CategoryStateStore(connection=self.connection)
+        self.seen_links = set()  # Product links found in this run, never tombstoned (with the persisted links of every category)
+
+        # Persistent slug -> magento category ids, only missing / expired slugs cost a contentful request
+        self.category_ids = CategoryIdStore(connection=self.connection, max_age=category_id_max_age)
+
+        # Resumable frontier shared by every worker process crawling into the same Database
+        self.frontier = CrawlFrontier(connection=self.connection, worker_id=worker_id, locales=list(self.locales))
+        self.resume = resume
+        self.claim_batch_size = claim_batch_size
+
+    def insert_product_link(self, product_link: str, prod_cat_link: str, locale: str):
+        # Queueing the row for the batched insert into Database, linked to its product category (which carries the sub / main lineage)
+        self.writer.add(product_link=product_link, product_category_id=self.category_tree.product_category_ids.get(prod_cat_link), locale=locale)
 
+    def category_key(self, prod_category: dict) -> str:
+        # Key of a product category in the category id store, contentful resolves slugs per locale
+        return f"{prod_category['locale']}:{category_slug(prod_cat_link=prod_category['prod_cat_link'], locale=prod_category['locale'])}"
+
+    def state_key(self, prod_category: dict, category_id: str) -> str:
+        # Key of a magento category in the crawl state, its product links are locale specific even when locales share a store
+        return f"{prod_category['locale']}:{category_id}"
+
+    def collect_categories(self, parsed_html, locale: str) -> tuple:
+        # Walks the navigation menu of a locale and returns (main categories, sub categories, shop links, product category links)
         xpath_main_categories = '//li[contains(@class, "nav-main__item nav-main__item--level-2")]/a[@class="nav-main__item-link"]'
         main_categories_links_relative = parsed_html.xpath(xpath_main_categories)[1:8]
-        main_page_link_concat = self.main_page_url.replace('/en-us/', '')
+        main_page_link_concat = self.base_url
+        main_categories = list()
+        sub_categories = list()
+        shop_links = list()
+        prod_categories = list()
         # Iterating on each main categories Elements for retrieving their data
-        slug_counter = 0
         for main_cat_elem in main_categories_links_relative:
             main_category_name = ' '.join(main_cat_elem.xpath('.//text()'))
-            if main_category_name not in ['Kits & Bundles', 'Software']:
-                print('Main Category Name: ', main_category_name)
-                main_cat_link = main_page_link_concat + ' '.join(main_cat_elem.xpath('./@href'))
-                print('Main Category Link: ', main_cat_link)
-                # Iterating on each Sub-Categories Elements for retrieving their data
-                sub_category_elements = main_cat_elem.xpath('./following-sibling::ul/li/a[not(contains(text(), "All"))][span]')
-                # sub_category_elements = main_cat_elem.xpath('./following-sibling::ul/li/a/span[not(contains(text(), "All"))]')
-                print('+' * 10)
-                print(sub_category_elements)
-                # Iterating on each Sub Categories Elements for retrieving their data
-                for sub_cat_elm in sub_category_elements:
-                    sub_cat_name = ' '.join(sub_cat_elm.xpath('./span/text()'))
-                    sub_cat_link = main_page_link_concat + ' '.join(sub_cat_elm.xpath('./@href[not(contains(@href, "all"))]'))
-                    if 'all' not in sub_cat_name.lower():
-                        print(sub_cat_elm)
-                        print('Sub-Category Name: ', sub_cat_name)
-                        print('Sub-Category Link: ', sub_cat_link)
-                        prod_cat_links_related = sub_cat_elm.xpath('./following-sibling::ul/li/a/@href')
-                        prod_cat_links_list = [main_page_link_concat + prod_cat_link for prod_cat_link in prod_cat_links_related]
-                        # Iterating on each Product Category Elements for retrieving their data
-                        for prod_cat_link in prod_cat_links_list:
-                            if '/shop/' in prod_cat_link:  # If the Product category is the direct link to a particular product of the sub-category, Storing Their link in Database table
-                                print('Prod Shop Link: ', prod_cat_link)
-
-                                # Inserting into Database
-                                data_dict = dict()
-                                metadata_list = list()
-                                metadata_list.append({'main category link': main_cat_link})
-                                metadata_list.append({'Sub category link': main_cat_link})
-                                metadata_list.append({'Prod category link': 'N/A'})
-
-                                metadata = json.dumps(metadata_list)
-                                data_dict.update({'product_link': prod_cat_link})
-                                data_dict.update({'metadata': metadata})
-
-                                print(data_dict)
-                                print('Storing into Database')
-                                try:
-                                    cols = data_dict.keys()
-                                    rows = data_dict.values()
-                                    insert_query = f'''INSERT INTO `products_links` ({', '.join(tuple(cols))}) VALUES ({('%s, ' * len(data_dict)).rstrip(", ")});'''
-                                    print(insert_query)
-                                    self.cursor.execute(query=insert_query, args=tuple(rows))
-                                except Exception as e:
-                                    print(e)
-
-                            else:  # If the Product Category links are links to 1st page of them
-                                product_cat_link_template = 'https://www.baslerweb.com/api/magento/products?store=amer_en&locale=en-us&filters=%7B%22sort_dir%22:%5B%22asc%22%5D,%22page%22:%5B%22-PAGE_NO-%22%5D,%22category_id%22:%5B%22-C_I_D-%22%5D%7D'
-                                print('Prod Cat Link: ', prod_cat_link)
-                                slug = prod_cat_link.split('/en-us/')[1]
-                                print('Slug: ', slug)
-                                if not slug.endswith('/'):
-                                    if '#products' in slug:
-                                        slug = slug.replace('/?', '&').replace('/#products', '').replace('#products', '')
-                                        cat_id_link = f'https://www.baslerweb.com/api/contentful?slug={slug}&locale=en-us'
-                                        print('Category Id Link: ', cat_id_link)
-                                        print('=' * 25)
-                                        cat_id_response = page_checker_json(url=cat_id_link, method='GET', directory_path=os.path.join(self.project_files_dir, 'Category_id_jsons'))
-                                        checker_list = cat_id_response.get('entry').get('linkedEntries').keys()
-                                        for key_check in checker_list:
-                                            key_check_list = cat_id_response.get('entry').get('linkedEntries').get(key_check).get('fields').keys()
-                                            if 'staticFilters' in key_check_list:
-                                                category_id = cat_id_response.get('entry').get('linkedEntries').get(key_check).get('fields').get('staticFilters').get('category_id')
-                                                print('Category Id: ', category_id)
-                                                product_cat_link_template = product_cat_link_template.replace("-PAGE_NO-", f'{1}').replace('-C_I_D-', category_id[0])
-                                                response_dict = page_checker_json(url=product_cat_link_template, method='GET', directory_path=os.path.join(self.project_files_dir, 'Product_Pages'))
-                                                products_count = response_dict.get('total_count')
-                                                print('Products Count: ', products_count)
-                                                page_count = math.ceil(products_count/21)
-                                                print('Page Count: ', page_count)
-                                                for page_no in range(1, page_count+1):
-                                                    product_cat_link_template = 'https://www.baslerweb.com/api/magento/products?store=amer_en&locale=en-us&filters=%7B%22sort_dir%22:%5B%22asc%22%5D,%22page%22:%5B%22-PAGE_NO-%22%5D,%22category_id%22:%5B%22-C_I_D-%22%5D%7D'
-                                                    product_cat_link_template = product_cat_link_template.replace("-PAGE_NO-", f'{page_no}').replace('-C_I_D-', category_id[0])
-                                                    response_dict = page_checker_json(url=product_cat_link_template, method='GET', directory_path=os.path.join(self.project_files_dir, 'Product_Pages'))
-                                                    prod_items = response_dict.get('items')
-                                                    for prod_dict in prod_items:
-                                                        product_url_key = prod_dict.get('url_key')
-                                                        print(product_url_key)
-                                                        product_link = f'https://www.baslerweb.com/en-us/shop/{product_url_key}'
-                                                        # Inserting into Database
-                                                        data_dict = dict()
-                                                        metadata_list = list()
-                                                        metadata_list.append({'main category link': main_cat_link})
-                                                        metadata_list.append({'Sub category link': sub_cat_link})
-                                                        metadata_list.append({'Prod category link': prod_cat_link})
-
-                                                        metadata = json.dumps(metadata_list)
-                                                        data_dict.update({'product_link': product_link})
-                                                        data_dict.update({'metadata': metadata})
-
-                                                        print(data_dict)
-                                                        print('Storing into Database')
-                                                        try:
-                                                            cols = data_dict.keys()
-                                                            rows = data_dict.values()
-                                                            insert_query = f'''INSERT INTO `products_links` ({', '.join(tuple(cols))}) VALUES ({('%s, ' * len(data_dict)).rstrip(", ")});'''
-                                                            print(insert_query)
-                                                            self.cursor.execute(query=insert_query, args=tuple(rows))
-                                                        except Exception as e:
-                                                            print(e)
-                                                print('----')
-                                        slug_counter += 1
-                                        print(slug_counter)
-                                    else:
-                                        cat_id_link = f'https://www.baslerweb.com/api/contentful?slug={slug}&locale=en-us'
-                                        print('Category Id Link: ', cat_id_link)
-                                        print('=' * 25)
-                                        cat_id_response = page_checker_json(url=cat_id_link, method='GET', directory_path=os.path.join(self.project_files_dir, 'Category_id_jsons'))
-                                        checker_list = cat_id_response.get('entry').get('linkedEntries').keys()
-                                        for key_check in checker_list:
-                                            key_check_list = cat_id_response.get('entry').get('linkedEntries').get(key_check).keys()
-                                            for key in key_check_list:
-                                                if key is not None:
-                                                    c_id = cat_id_response.get('entry').get('linkedEntries').get(key_check).get('fields').get('staticFilters')
-                                                    if c_id is not None:
-                                                        category_id = c_id.get('category_id')
-                                                        print('Category Id: ', category_id)
-                                                        product_cat_link_template = product_cat_link_template.replace("-PAGE_NO-", f'{1}').replace('-C_I_D-', category_id[0])
-                                                        response_dict = page_checker_json(url=product_cat_link_template, method='GET', directory_path=os.path.join(self.project_files_dir, 'Product_Pages'))
-                                                        products_count = response_dict.get('total_count')
-                                                        print('Products Count: ', products_count)
-                                                        page_count = math.ceil(products_count/21)
-                                                        print('Page Count: ', page_count)
-                                                        for page_no in range(1, page_count + 1):
-                                                            product_cat_link_template = 'https://www.baslerweb.com/api/magento/products?store=amer_en&locale=en-us&filters=%7B%22sort_dir%22:%5B%22asc%22%5D,%22page%22:%5B%22-PAGE_NO-%22%5D,%22category_id%22:%5B%22-C_I_D-%22%5D%7D'
-                                                            product_cat_link_template = product_cat_link_template.replace("-PAGE_NO-", f'{page_no}').replace('-C_I_D-', category_id[0])
-                                                            response_dict = page_checker_json(url=product_cat_link_template, method='GET', directory_path=os.path.join(self.project_files_dir, 'Product_Pages'))
-                                                            prod_items = response_dict.get('items')
-                                                            for prod_dict in prod_items:
-                                                                product_url_key = prod_dict.get('url_key')
-                                                                print(product_url_key)
-                                                                product_link = f'https://www.baslerweb.com/en-us/shop/{product_url_key}'
-                                                                # Inserting into Database
-                                                                data_dict = dict()
-                                                                metadata_list = list()
-                                                                metadata_list.append({'main category link': main_cat_link})
-                                                                metadata_list.append({'Sub category link': sub_cat_link})
-                                                                metadata_list.append({'Prod category link': prod_cat_link})
-
-                                                                metadata = json.dumps(metadata_list)
-                                                                data_dict.update({'product_link': product_link})
-                                                                data_dict.update({'metadata': metadata})
-
-                                                                print(data_dict)
-                                                                print('Storing into Database')
-                                                                try:
-                                                                    cols = data_dict.keys()
-                                                                    rows = data_dict.values()
-                                                                    insert_query = f'''INSERT INTO `products_links` ({', '.join(tuple(cols))}) VALUES ({('%s, ' * len(data_dict)).rstrip(", ")});'''
-                                                                    print(insert_query)
-                                                                    self.cursor.execute(query=insert_query, args=tuple(rows))
-                                                                except Exception as e:
-                                                                    print(e)
-                                        slug_counter += 1
-                                        print(slug_counter)
-                                else:
-                                    print('p' * 80)
-                                    slug = slug[:-1]
-                                    cat_id_link = f'https://www.baslerweb.com/api/contentful?slug={slug}&locale=en-us'
-                                    print('Category Id Link: ', cat_id_link)
-                                    print('=' * 25)
-                                    # continue
-                                    cat_id_response = page_checker_json(url=cat_id_link, method='GET', directory_path=os.path.join(self.project_files_dir, 'Category_id_jsons'))
-                                    checker_list = cat_id_response.get('entry').get('linkedEntries').keys()
-                                    for key_check in checker_list:
-                                        key_check_list = cat_id_response.get('entry').get('linkedEntries').get(key_check).keys()
-                                        if 'fields' in key_check_list:
-                                            c_id = cat_id_response.get('entry').get('linkedEntries').get(key_check).get('fields').get('staticFilters')
-                                            if c_id is not None:
-                                                category_id = c_id.get('category_id')
-                                                print('Category Id: ', category_id)
-                                                product_cat_link_template = product_cat_link_template.replace("-PAGE_NO-", f'{1}').replace('-C_I_D-', category_id[0])
-                                                response_dict = page_checker_json(url=product_cat_link_template, method='GET', directory_path=os.path.join(self.project_files_dir, 'Product_Pages'))
-                                                products_count = response_dict.get('total_count')
-                                                print('Products Count: ', products_count)
-                                                page_count = math.ceil(products_count/21)
-                                                print('Page Count: ', page_count)
-                                                for page_no in range(1, page_count+1):
-                                                    product_cat_link_template = 'https://www.baslerweb.com/api/magento/products?store=amer_en&locale=en-us&filters=%7B%22sort_dir%22:%5B%22asc%22%5D,%22page%22:%5B%22-PAGE_NO-%22%5D,%22category_id%22:%5B%22-C_I_D-%22%5D%7D'
-                                                    product_cat_link_template = product_cat_link_template.replace("-PAGE_NO-", f'{page_no}').replace('-C_I_D-', category_id[0])
-                                                    response_dict = page_checker_json(url=product_cat_link_template, method='GET', directory_path=os.path.join(self.project_files_dir, 'Product_Pages'))
-                                                    prod_items = response_dict.get('items')
-                                                    for prod_dict in prod_items:
-                                                        product_url_key = prod_dict.get('url_key')
-                                                        print(product_url_key)
-                                                        product_link = f'https://www.baslerweb.com/en-us/shop/{product_url_key}'
-                                                        # Inserting into Database
-                                                        data_dict = dict()
-                                                        metadata_list = list()
-                                                        metadata_list.append({'main category link': main_cat_link})
-                                                        metadata_list.append({'Sub category link': sub_cat_link})
-                                                        metadata_list.append({'Prod category link': prod_cat_link})
-
-                                                        metadata = json.dumps(metadata_list)
-                                                        data_dict.update({'product_link': product_link})
-                                                        data_dict.update({'metadata': metadata})
-
-                                                        print(data_dict)
-                                                        print('Storing into Database')
-                                                        try:
-                                                            cols = data_dict.keys()
-                                                            rows = data_dict.values()
-                                                            insert_query = f'''INSERT INTO `products_links` ({', '.join(tuple(cols))}) VALUES ({('%s, ' * len(data_dict)).rstrip(", ")});'''
-                                                            print(insert_query)
-                                                            self.cursor.execute(query=insert_query, args=tuple(rows))
-                                                        except Exception as e:
-                                                            print(e)
-                                    slug_counter += 1
-                                    print(slug_counter)
-                                print('Done', prod_cat_link)
-                            print('*' * 5)
-                        print('+' * 20) 
-                print('-' * 30)
-
-
-Scraper().scrape()
+            main_cat_link = main_page_link_concat + ' '.join(main_cat_elem.xpath('./@href'))
+            if link_slug_words(link=main_cat_link) & EXCLUDED_MAIN_CATEGORY_WORDS:
+                continue
+            logger.debug('Main Category Name: %s', main_category_name)
+            logger.debug('Main Category Link: %s', main_cat_link)
+            main_categories.append((main_category_name, main_cat_link))
+            # Iterating on each Sub Categories Elements for retrieving their data
+            sub_category_elements = main_cat_elem.xpath('./following-sibling::ul/li/a[span]')
+            for sub_cat_elm in sub_category_elements:
+                sub_cat_name = ' '.join(sub_cat_elm.xpath('./span/text()'))
+                sub_cat_link = main_page_link_concat + ' '.join(sub_cat_elm.xpath('./@href'))
+                # The "All ..." entry links back to the main category or to an all-... overview page
+                if sub_cat_link.rstrip('/') == main_cat_link.rstrip('/') or 'all' in link_slug_words(link=sub_cat_link):
+                    continue
+                logger.debug('Sub-Category Name: %s', sub_cat_name)
+                logger.debug('Sub-Category Link: %s', sub_cat_link)
+                sub_categories.append((sub_cat_name, sub_cat_link, main_cat_link))
+                prod_cat_elements = sub_cat_elm.xpath('./following-sibling::ul/li/a')
+                # Iterating on each Product Category Elements for retrieving their data
+                for prod_cat_elm in prod_cat_elements:
+                    prod_cat_name = ' '.join(prod_cat_elm.xpath('.//text()')).strip()
+                    prod_cat_link = main_page_link_concat + ' '.join(prod_cat_elm.xpath('./@href'))
+                    lineage = {'main_cat_link': main_cat_link, 'sub_cat_link': sub_cat_link, 'prod_cat_link': prod_cat_link, 'prod_cat_name': prod_cat_name, 'locale': locale}
+                    if '/shop/' in prod_cat_link:  # If the Product category is the direct link to a particular product of the sub-category
+                        shop_links.append(lineage)
+                    else:  # If the Product Category links are links to 1st page of them
+                        prod_categories.append(lineage)
+        return main_categories, sub_categories, shop_links, prod_categories
+
+    async def fetch_first_page(self, fetcher: AsyncFetcher, prod_category: dict, category_id: str, revalidate: bool) -> tuple:
+        # Returns (first page, page size the API used), probing the page size: a short first page shows the server cap
+        product_pages_dir = os.path.join(self.project_files_dir, 'Product_Pages')
+        template = self.product_cat_link_templates[prod_category['locale']]
+        page_size = self.page_size
+        response_dict = await fetcher.fetch(page_checker_json, url=magento_page_url(template=template, category_id=category_id, page_no=1, page_size=page_size),
+                                            method='GET', directory_path=product_pages_dir, revalidate=revalidate)
+        if response_dict is None and page_size > DEFAULT_PAGE_SIZE:
+            # Retry this category once at the listing's own size, a failure at both sizes is the category's problem, not the page size's
+            response_dict = await fetcher.fetch(page_checker_json, url=magento_page_url(template=template, category_id=category_id, page_no=1, page_size=DEFAULT_PAGE_SIZE),
+                                                method='GET', directory_path=product_pages_dir, revalidate=revalidate)
+            if response_dict is not None:
+                # The API rejected the larger page size instead of capping it, later categories ask for the listing's own
+                logger.warning('Page size %s rejected for category %s, using %s', page_size, category_id, DEFAULT_PAGE_SIZE)
+                self.page_size = min(self.page_size, DEFAULT_PAGE_SIZE)
+            page_size = DEFAULT_PAGE_SIZE
+        if response_dict is None:
+            return None, page_size
+        items_count = len(response_dict.get('items') or list())
+        if 0 < items_count < min(page_size, response_dict.get('total_count') or 0):
+            if items_count < self.page_size:
+                logger.info('Magento page size capped at %s', items_count)
+                self.page_size = items_count  # Later categories ask for the cap right away
+            page_size = items_count
+        return response_dict, page_size
+
+    async def crawl_category(self, fetcher: AsyncFetcher, prod_category: dict, category_id: str) -> dict or None:
+        # Fetches every page of a magento category concurrently, returns {'total_count', 'page_size', 'pages', 'consistent'}
+        # Incremental mode revalidates every page (an unchanged one costs a 304): a product swapped on a later page keeps count and first page the same
+        # Pages that disagree on total_count or come back short mean the catalog changed mid-crawl: the category is planned and fetched again
+        product_pages_dir = os.path.join(self.project_files_dir, 'Product_Pages')
+        template = self.product_cat_link_templates[prod_category['locale']]
+        revalidate = self.incremental
+        for attempt in range(self.max_replans + 1):
+            response_dict, page_size = await self.fetch_first_page(fetcher=fetcher, prod_category=prod_category, category_id=category_id, revalidate=revalidate)
+            if response_dict is None:
+                logger.warning('Could not fetch first page of category %s', category_id)
+                return None
+            products_count = response_dict.get('total_count') or 0
+            logger.debug('Products Count: %s', products_count)
+            page_count = max(math.ceil(products_count/page_size), 1)
+            logger.debug('Page Count: %s (%s per page)', page_count, page_size)
+            self.frontier.add_pages(prod_category=prod_category, category_id=category_id, page_count=page_count, page_size=page_size)
+            # The first page is already here, only the remaining ones are requested
+            page_urls = [magento_page_url(template=template, category_id=category_id, page_no=page_no, page_size=page_size) for page_no in range(2, page_count+1)]
+            page_responses = await fetcher.fetch_all(page_checker_json, urls=page_urls, method='GET', directory_path=product_pages_dir, revalidate=revalidate)
+            for page_url, page_response in zip(page_urls, page_responses):
+                if page_response is None:
+                    logger.warning('Could not fetch %s', page_url)
+            pages = [response_dict] + page_responses
+            problem = pagination_problem(pages=pages, total_count=products_count, page_size=page_size)
+            if problem is None:
+                return {'total_count': products_count, 'page_size': page_size, 'pages': pages, 'consistent': True}
+            logger.info('Re-planning category %s: %s', category_id, problem)
+            revalidate = True  # The cached pages are the inconsistent ones, ask the server again
+        # Still inconsistent: the rows are upserted anyway, but no page is marked done and the missing last page
+        # keeps the old category state (no tombstones) and fails the category for a later retry
+        logger.warning('Pages of category %s still inconsistent after %s re-plans', category_id, self.max_replans)
+        return {'total_count': products_count, 'page_size': page_size, 'pages': pages + [None], 'consistent': False}
+
+    def store_category(self, category_id: str, crawl_result: dict, prod_category: dict) -> list:
+        # Upserts the products of the changed pages, queues tombstones for products gone from the category and returns the stored page numbers
+        state_key = self.state_key(prod_category=prod_category, category_id=category_id)
+        state = self.category_states.get(category_id=state_key)
+        old_page_hashes = state['page_hashes'] if state is not None else list()
+        done_pages = self.frontier.done_pages(prod_category=prod_category, category_id=category_id, page_size=crawl_result['page_size'])
+        page_hashes = list()
+        product_links = list()
+        stored_pages = list()
+        for page_index, page_response in enumerate(crawl_result['pages']):
+            if page_response is None:
+                page_hashes.append(None)
+                continue
+            page_no = page_index + 1
+            stored_pages.append(page_no)
+            items_hash = page_hash(response_dict=page_response)
+            page_hashes.append(items_hash)
+            page_links = [f'{self.main_page_urls[prod_category["locale"]]}shop/{prod_dict.get("url_key")}' for prod_dict in page_response.get('items') or list()]
+            product_links.extend(page_links)
+            if page_no in done_pages:
+                continue  # Stored by an interrupted earlier attempt
+            if self.incremental and page_index < len(old_page_hashes) and old_page_hashes[page_index] == items_hash:
+                continue  # Page content is the same as last crawl, its rows are already stored
+            for product_link in page_links:
+                self.insert_product_link(product_link=product_link, prod_cat_link=prod_category['prod_cat_link'], locale=prod_category['locale'])
+        self.seen_links.update(product_links)
+        metrics.record_rows(stage='Product_Pages', rows=len(product_links))
+        if None in page_hashes:
+            return stored_pages  # Incomplete crawl of the category, keep the old state so nothing is wrongly tombstoned
+        removed_links = set(state['product_links']) - set(product_links) if state is not None else set()
+        self.writer.tombstone(product_links=removed_links)
+        # The rows go in before the state that says they are stored, and the removals are saved with that state, so a crash loses neither
+        self.writer.flush()
+        self.category_states.save(category_id=state_key, total_count=crawl_result['total_count'], page_hashes=page_hashes, product_links=product_links, removed_links=removed_links)
+        return stored_pages
+
+    async def resolve_category_ids(self, fetcher: AsyncFetcher, prod_categories: list):
+        # Pre-pass over every nav slug of every locale: the ones missing from the category id store are resolved from contentful in parallel
+        # Also run before each claimed batch, for slugs an earlier attempt could not resolve or invalidated
+        self.category_ids.load()
+        prod_categories_by_key = {self.category_key(prod_category=prod_category): prod_category for prod_category in prod_categories}
+        keys = self.category_ids.missing(slugs=list(prod_categories_by_key))
+        if not keys:
+            return
+        cat_id_links = [self.contentful_url_templates[prod_categories_by_key[key]['locale']].replace('-SLUG-', category_slug(prod_cat_link=prod_categories_by_key[key]['prod_cat_link'],
+                                                                                                                            locale=prod_categories_by_key[key]['locale']))
+                        for key in keys]
+        with metrics.timer(metric='stage_seconds', stage='contentful_lookup'):
+            cat_id_responses = await asyncio.gather(*(fetcher.fetch(page_checker_json, url=cat_id_link, method='GET', directory_path=os.path.join(self.project_files_dir, 'Category_id_jsons'),
+                                                                    revalidate=key in self.category_ids.invalidated)
+                                                      for key, cat_id_link in zip(keys, cat_id_links)), return_exceptions=True)  # A malformed body only fails its own slug
+        resolved = dict()
+        for key, cat_id_link, cat_id_response in zip(keys, cat_id_links, cat_id_responses):
+            if cat_id_response is None or isinstance(cat_id_response, Exception):
+                logger.warning('Could not resolve category id from %s: %r', cat_id_link, cat_id_response)
+                continue
+            resolved[key] = category_ids_from_contentful(cat_id_response=cat_id_response)
+        self.category_ids.save(resolved=resolved)
+        logger.info('Resolved category ids of %s of %s new slugs', len(resolved), len(keys))
+
+    async def crawl_claimed(self, fetcher: AsyncFetcher, prod_categories: list):
+        # Crawling the pages of every category in parallel, storing each category as soon as it completes
+        crawl_tasks = dict()
+        open_crawls = dict()  # frontier id -> number of its category crawls still running
+        failed_ids = set()
+        for prod_category in prod_categories:
+            category_ids = self.category_ids.get(slug=self.category_key(prod_category=prod_category))
+            if category_ids is None:  # Contentful lookup failed in the pre-pass
+                self.frontier.fail(prod_category=prod_category)
+                continue
+            if not category_ids:
+                self.frontier.finish(prod_category=prod_category)  # Nothing to crawl behind this link
+                continue
+            self.category_tree.set_category_id(prod_cat_link=prod_category['prod_cat_link'], category_id=category_ids[0])
+            open_crawls[prod_category['frontier_id']] = len(category_ids)
+            for category_id in category_ids:
+                logger.debug('Category Id: %s', category_id)
+                crawl_task = asyncio.ensure_future(self.crawl_category(fetcher=fetcher, prod_category=prod_category, category_id=category_id))
+                crawl_tasks[crawl_task] = (prod_category, category_id)
+
+        pending_tasks = set(crawl_tasks)
+        while pending_tasks:
+            done_tasks, pending_tasks = await asyncio.wait(pending_tasks, return_when=asyncio.FIRST_COMPLETED)
+            for crawl_task in done_tasks:
+                prod_category, category_id = crawl_tasks[crawl_task]
+                try:
+                    crawl_result = crawl_task.result()
+                except Exception as e:  # e.g. a non-JSON body or a Database error, only this category fails
+                    logger.error('Crawling category %s of %s failed: %r', category_id, prod_category['prod_cat_link'], e)
+                    crawl_result = None
+                if crawl_result is None or None in crawl_result['pages']:
+                    failed_ids.add(prod_category['frontier_id'])
+                if crawl_result is None:  # The magento request for this id failed or errored, possibly a stale id: ask contentful again before a retry
+                    self.category_ids.invalidate(slug=self.category_key(prod_category=prod_category))
+                if crawl_result is not None:
+                    try:
+                        stored_pages = self.store_category(category_id=category_id, crawl_result=crawl_result, prod_category=prod_category)
+                        self.writer.flush()
+                        if crawl_result['consistent']:
+                            self.frontier.mark_pages_done(prod_category=prod_category, category_id=category_id, page_nos=stored_pages)
+                    except Exception as e:
+                        logger.error('Storing category %s of %s failed: %r', category_id, prod_category['prod_cat_link'], e)
+                        failed_ids.add(prod_category['frontier_id'])
+                open_crawls[prod_category['frontier_id']] -= 1
+                if open_crawls[prod_category['frontier_id']] == 0:
+                    if prod_category['frontier_id'] in failed_ids:
+                        self.frontier.fail(prod_category=prod_category)
+                    else:
+                        self.frontier.finish(prod_category=prod_category)
+                    logger.info('Done %s', prod_category['prod_cat_link'])
+
+    async def keep_claims_alive(self):
+        # Renews the frontier lease while categories are being crawled, so only the claims of dead workers expire
+        while True:
+            await asyncio.sleep(self.frontier.lease_seconds / 3)
+            self.frontier.heartbeat()
+
+    async def crawl_categories(self, prod_categories: list):
+        # Resolves the category ids of the nav, then claims product categories from the frontier until no pending ones are left
+        fetcher = AsyncFetcher(max_per_host=self.max_per_host, max_workers=self.max_workers)
+        heartbeat_task = asyncio.ensure_future(self.keep_claims_alive())
+        try:
+            await self.resolve_category_ids(fetcher=fetcher, prod_categories=prod_categories)
+            while True:
+                prod_categories = self.frontier.claim(batch_size=self.claim_batch_size)
+                if not prod_categories:
+                    retry_seconds = self.frontier.next_retry_seconds()
+                    if retry_seconds is None:
+                        break
+                    logger.info('Waiting %ss to retry failed categories', retry_seconds)
+                    await asyncio.sleep(retry_seconds)
+                    continue
+                if self.category_ids.missing(slugs=[self.category_key(prod_category=prod_category) for prod_category in prod_categories]):
+                    await self.resolve_category_ids(fetcher=fetcher, prod_categories=prod_categories)
+                await self.crawl_claimed(fetcher=fetcher, prod_categories=prod_categories)
+                self.frontier.update_parents()
+        finally:
+            heartbeat_task.cancel()
+            fetcher.close()
+
+    def scrape(self):
+        metrics.reset()
+        try:
+            self.crawl()
+        finally:
+            metrics.emit(path=self.metrics_path, output_format=self.metrics_format)
+
+    async def fetch_main_pages(self) -> list:
+        # Main pages of every locale in parallel, in the order of self.locales
+        fetcher = AsyncFetcher(max_per_host=self.max_per_host, max_workers=len(self.locales))
+        try:
+            return await fetcher.fetch_all(page_checker, urls=list(self.main_page_urls.values()), method='GET', directory_path=os.path.join(self.project_files_dir, 'Main_Page'))
+        finally:
+            fetcher.close()
+
+    def crawl(self):
+        main_categories = list()
+        sub_categories = list()
+        shop_links = list()
+        prod_categories = list()
+        with metrics.timer(metric='stage_seconds', stage='main_page'):
+            main_page_texts = asyncio.run(self.fetch_main_pages())
+            for locale, main_page_text in zip(self.main_page_urls, main_page_texts):
+                if main_page_text is None:
+                    logger.error('Could not fetch main page %s', self.main_page_urls[locale])
+                    continue
+                parsed_html = html.fromstring(main_page_text)  # Parsing the main page response text
+                locale_categories = self.collect_categories(parsed_html=parsed_html, locale=locale)
+                for categories, locale_entries in zip((main_categories, sub_categories, shop_links, prod_categories), locale_categories):
+                    categories.extend(locale_entries)
+            if not main_categories:
+                return
+        self.category_states.load()
+        self.writer.tombstone(product_links=self.category_states.pending_removals())  # Left over by an interrupted run
+        # Shop links sit at the product category level of the nav tree, so they are stored as product categories too
+        self.category_tree.store(main_categories=main_categories, sub_categories=sub_categories,
+                                 prod_categories=[(lineage['prod_cat_name'], lineage['prod_cat_link'], lineage['sub_cat_link']) for lineage in shop_links + prod_categories])
+        self.frontier.seed(prod_categories=prod_categories, resume=self.resume)
+
+        with self.writer:
+            # Storing direct product (shop) links of the sub-categories in Database table
+            for shop_link in shop_links:
+                logger.debug('Prod Shop Link: %s', shop_link['prod_cat_link'])
+                self.seen_links.add(shop_link['prod_cat_link'])
+                self.insert_product_link(product_link=shop_link['prod_cat_link'], prod_cat_link=shop_link['prod_cat_link'], locale=shop_link['locale'])
+            self.writer.flush()
+
+            with metrics.timer(metric='stage_seconds', stage='category_crawl'):
+                asyncio.run(self.crawl_categories(prod_categories=prod_categories))
+            self.writer.flush()
+            # A product that moved to a category crawled by another worker / an earlier run is listed in that category's state
+            self.writer.flush_tombstones(keep_links=self.seen_links | self.category_states.live_links(locales=list(self.locales)))
+            self.category_states.clear_pending_removals()
+        logger.info('Total product links stored: %s', self.writer.rows_written)
+        logger.info('Response archive: %s', self.cache.stats())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl the baslerweb.com category tree and product links into products_links')
+    parser.add_argument('--locales', default='en-us:amer_en', help='Comma separated locale:store pairs crawled in one run')
+    parser.add_argument('--incremental', action='store_true', help='Revalidate cached pages and only rewrite pages whose products changed since the last crawl')
+    parser.add_argument('--worker-id', default=None, help='Name of this worker in the crawl frontier, reuse it after a crash to take back its own claims right away')
+    parser.add_argument('--no-resume', dest='resume', action='store_false', help='Start a new crawl instead of resuming the unfinished one')
+    parser.add_argument('--claim-batch-size', type=int, default=16, help='Frontier categories claimed at a time')
+    parser.add_argument('--replay', action='store_true', help='Serve every request from the response archive, nothing is fetched')
+    parser.add_argument('--revalidate', action='store_true', help='Revalidate every cached response with the server')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='Seconds a cached response stays fresh')
+    parser.add_argument('--cache-max-bytes', type=int, default=None, help='Oldest cached responses are evicted above this size')
+    parser.add_argument('--max-per-host', type=int, default=8, help='Concurrent requests per host')
+    parser.add_argument('--max-workers', type=int, default=32, help='Threads fetching pages')
+    parser.add_argument('--requests-per-second', type=float, default=0, help='Request rate limit, 0 for none')
+    parser.add_argument('--batch-size', type=int, default=500, help='Rows per products_links insert')
+    parser.add_argument('--max-page-size', type=int, default=500, help='Magento page size asked for before the server cap is known')
+    parser.add_argument('--log-level', default='INFO', help='DEBUG logs every request')
+    parser.add_argument('--metrics-path', default=None, help='Write the end of run metrics to this file')
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json')
+    arguments = parser.parse_args()
+
+    Scraper(max_per_host=arguments.max_per_host, max_workers=arguments.max_workers, requests_per_second=arguments.requests_per_second, batch_size=arguments.batch_size,
+            cache_ttl=arguments.cache_ttl, cache_max_bytes=arguments.cache_max_bytes, revalidate=arguments.revalidate, incremental=arguments.incremental,
+            worker_id=arguments.worker_id, resume=arguments.resume, claim_batch_size=arguments.claim_batch_size, max_page_size=arguments.max_page_size,
+            replay=arguments.replay, locales=dict(pair.split(':', 1) for pair in arguments.locales.split(',')), log_level=arguments.log_level,
+            metrics_path=arguments.metrics_path, metrics_format=arguments.metrics_format).scrape()
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import urlopen
+
+
+class SimulatedCatalog:
+    """Synthetic Basler catalog: main nav page, contentful slug lookups and paginated magento product listings.
+
+    Every locale serves the same nav and products under its own /<locale>/ path.
+    """
+
+    def __init__(self, main_categories: int = 5, sub_categories: int = 3, product_categories: int = 4, products_per_category: int = 60,
+                 shop_links_per_sub: int = 1, page_size: int = 21, max_page_size: int = 100, seed: int = 0):
+        if main_categories > 7:
+            raise ValueError('The crawler reads at most 7 main categories from the nav')
+        self.main_categories = main_categories
+        self.sub_categories = sub_categories
+        self.product_categories = product_categories
+        self.shop_links_per_sub = shop_links_per_sub
+        self.page_size = page_size  # Used when a request has no page_size filter
+        self.max_page_size = max_page_size  # Larger page_size filters are capped silently, like the magento API does
+        self.category_ids = dict()  # contentful slug -> magento category id
+        self.category_sizes = dict()  # magento category id -> number of products
+        random_generator = random.Random(seed)
+        for main_index in range(main_categories):
+            for sub_index in range(sub_categories):
+                for prod_index in range(product_categories):
+                    category_id = str(1000 + len(self.category_ids))
+                    self.category_ids[f'products/main-{main_index}/sub-{sub_index}/prod-{prod_index}'] = category_id
+                    # Sizes vary around products_per_category so categories have different page counts
+                    self.category_sizes[category_id] = max(1, int(products_per_category * random_generator.uniform(0.5, 1.5)))
+
+    @property
+    def total_products(self) -> int:
+        return sum(self.category_sizes.values()) + self.main_categories * self.sub_categories * self.shop_links_per_sub
+
+    def main_page(self, locale: str = 'en-us') -> str:
+        # Same structure as the baslerweb.com nav the crawler's xpaths expect, the first level-2 item is skipped by the crawler
+        nav_items = [f'<li class="nav-main__item nav-main__item--level-2"><a class="nav-main__item-link" href="/{locale}/home/">Home</a></li>']
+        for main_index in range(self.main_categories):
+            sub_items = list()
+            for sub_index in range(self.sub_categories):
+                prod_items = list()
+                for prod_index in range(self.product_categories):
+                    slug = f'products/main-{main_index}/sub-{sub_index}/prod-{prod_index}'
+                    href = f'/{locale}/{slug}/' if prod_index % 2 == 0 else f'/{locale}/{slug}'  # Both link shapes the crawler handles
+                    prod_items.append(f'<li><a href="{href}">Prod {main_index}-{sub_index}-{prod_index}</a></li>')
+                for shop_index in range(self.shop_links_per_sub):
+                    prod_items.append(f'<li><a href="/{locale}/shop/shop-{main_index}-{sub_index}-{shop_index}/">Shop {main_index}-{sub_index}-{shop_index}</a></li>')
+                sub_items.append(f'<li><a href="/{locale}/products/main-{main_index}/sub-{sub_index}/"><span>Sub {main_index}-{sub_index}</span></a><ul>{"".join(prod_items)}</ul></li>')
+            nav_items.append(f'<li class="nav-main__item nav-main__item--level-2"><a class="nav-main__item-link" href="/{locale}/products/main-{main_index}/">Main {main_index}</a>'
+                             f'<ul>{"".join(sub_items)}</ul></li>')
+        return f'<html><body><nav><ul>{"".join(nav_items)}</ul></nav></body></html>'
+
+    def contentful(self, slug: str) -> dict or None:
+        category_id = self.category_ids.get(slug)
+        if category_id is None:
+            return None
+        return {'entry': {'linkedEntries': {'hero': {'fields': {'title': slug}},
+                                           'productList': {'fields': {'staticFilters': {'category_id': [category_id]}}}}}}
+
+    def magento(self, category_id: str, page_no: int, page_size: int) -> dict:
+        total_count = self.category_sizes.get(category_id, 0)
+        first_index = (page_no - 1) * page_size
+        items = [{'url_key': f'product-{category_id}-{index}', 'sku': f'SKU-{category_id}-{index}', 'name': f'Product {category_id}-{index}',
+                  'stock_status': 'IN_STOCK', 'price_range': {'minimum_price': {'final_price': {'value': 100 + index, 'currency': 'USD'}}}}
+                 for index in range(first_index, min(first_index + page_size, total_count))]
+        return {'items': items, 'total_count': total_count}
+
+
+class SimulatorServer:
+    """Serves a SimulatedCatalog on 127.0.0.1 with a configurable latency per request."""
+
+    def __init__(self, catalog: SimulatedCatalog, latency: float = 0.0, jitter: float = 0.0, port: int = 0):
+        self.catalog = catalog
+        self.latency = latency
+        self.jitter = jitter
+        self.requests_served = 0
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler_class(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real site
+
+            def do_GET(self):
+                if self.path == '/__stats':  # Counters for a benchmark running in another process, not counted themselves
+                    self.send_body(status=200, content_type='application/json', body=json.dumps(simulator.stats()).encode('UTF-8'))
+                    return
+                if simulator.latency or simulator.jitter:
+                    time.sleep(simulator.latency + random.uniform(0, simulator.jitter))
+                status, content_type, body = simulator.respond(path=self.path)
+                self.send_body(status=status, content_type=content_type, body=body)
+                with simulator._lock:
+                    simulator.requests_served += 1
+                    simulator.bytes_served += len(body)
+
+            def send_body(self, status: int, content_type: str, body: bytes):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # One line per request would dominate a benchmark run
+
+        return Handler
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'requests': self.requests_served, 'response_bytes': self.bytes_served, 'total_products': self.catalog.total_products}
+
+    def respond(self, path: str) -> tuple:
+        url_parts = urlsplit(path)
+        query = parse_qs(url_parts.query)
+        main_page_match = re.fullmatch(r'/([a-z]{2}-[a-z]{2})/', url_parts.path)
+        if main_page_match is not None:
+            return 200, 'text/html; charset=utf-8', self.catalog.main_page(locale=main_page_match.group(1)).encode('UTF-8')
+        if url_parts.path == '/api/contentful':
+            response_dict = self.catalog.contentful(slug=query.get('slug', [''])[0])
+            if response_dict is None:
+                return 404, 'application/json', b'{"message": "not found"}'
+            return 200, 'application/json', json.dumps(response_dict).encode('UTF-8')
+        if url_parts.path == '/api/magento/products':
+            filters = json.loads(query.get('filters', ['{}'])[0])
+            page_no = int((filters.get('page') or ['1'])[0])
+            category_id = (filters.get('category_id') or [''])[0]
+            page_size = min(int((filters.get('page_size') or [self.catalog.page_size])[0]), self.catalog.max_page_size)
+            response_dict = self.catalog.magento(category_id=category_id, page_no=page_no, page_size=page_size)
+            return 200, 'application/json', json.dumps(response_dict).encode('UTF-8')
+        return 404, 'text/plain', b'not found'
+
+    def serve_forever(self):
+        # Serves in the calling thread until stop() / KeyboardInterrupt, used when the simulator runs as its own process
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, name='basler-simulator', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class SimulatorProcess:
+    """Runs a SimulatorServer in a child python process, so its threads and memory are not measured with the crawler.
+
+    catalog_options are the SimulatedCatalog keyword arguments, counters are read over HTTP from /__stats.
+    """
+
+    def __init__(self, catalog_options: dict = None, latency: float = 0.0, jitter: float = 0.0, port: int = 0):
+        self.catalog_options = dict(catalog_options or dict())
+        self.latency = latency
+        self.jitter = jitter
+        self.port = port  # A fixed port keeps the urls, and so the response cache keys, the same from one process to the next
+        self.base_url = None
+        self._process = None
+
+    def start(self) -> str:
+        command = [sys.executable, os.path.abspath(__file__), '--latency', str(self.latency), '--jitter', str(self.jitter), '--port', str(self.port)]
+        for option, value in self.catalog_options.items():
+            command.extend([f'--{option.replace("_", "-")}', str(value)])
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        self.base_url = self._process.stdout.readline().strip()  # The child prints its base url once it listens
+        if not self.base_url:
+            self._process.wait()
+            raise RuntimeError(f'Simulator process exited with code {self._process.returncode} before serving')
+        return self.base_url
+
+    def stats(self) -> dict:
+        with urlopen(f'{self.base_url}/__stats') as response:
+            return json.loads(response.read())
+
+    def stop(self):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process.stdout.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a synthetic Basler / Magento catalog on 127.0.0.1, prints the base url once listening')
+    parser.add_argument('--main-categories', type=int, default=5, help='At most 7, like the real nav')
+    parser.add_argument('--sub-categories', type=int, default=3, help='Sub categories per main category')
+    parser.add_argument('--product-categories', type=int, default=4, help='Product categories per sub category')
+    parser.add_argument('--products-per-category', type=int, default=60, help='Average products per product category')
+    parser.add_argument('--shop-links-per-sub', type=int, default=1, help='Direct /shop/ links per sub category')
+    parser.add_argument('--page-size', type=int, default=21, help='Magento page size of requests without a page_size filter')
+    parser.add_argument('--max-page-size', type=int, default=100, help='Largest magento page size served')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic catalog')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds waited before every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    parser.add_argument('--port', type=int, default=0, help='Any free port by default')
+    arguments = parser.parse_args()
+
+    simulator_catalog = SimulatedCatalog(main_categories=arguments.main_categories, sub_categories=arguments.sub_categories, product_categories=arguments.product_categories,
+                                         products_per_category=arguments.products_per_category, shop_links_per_sub=arguments.shop_links_per_sub,
+                                         page_size=arguments.page_size, max_page_size=arguments.max_page_size, seed=arguments.seed)
+    simulator_server = SimulatorServer(catalog=simulator_catalog, latency=arguments.latency, jitter=arguments.jitter, port=arguments.port)
+    print(simulator_server.base_url, flush=True)
+    simulator_server.serve_forever()
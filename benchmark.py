@@ -0,0 +1,127 @@
+import argparse
+import json
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+import pymysql
+
+import mysql_stand_in
+from basler_main_category import Scraper
+from basler_simulator import SimulatorProcess
+from crawl_metrics import metrics
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb() -> float or None:
+    # Peak resident set size of this process (the simulator runs in its own), ru_maxrss is in KB on Linux and in bytes on macOS
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def fresh_database(host: str, user: str, password: str, database: str):
+    # Drops and recreates the benchmark database so every run starts from empty tables
+    # Needs a running MySQL server and a user allowed to DROP / CREATE DATABASE
+    with pymysql.connect(host=host, user=user, password=password, charset='utf8mb4', autocommit=True) as server_connection:
+        with server_connection.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS `{database}`;')
+            cursor.execute(f'CREATE DATABASE `{database}` CHARACTER SET utf8mb4;')
+    return pymysql.connect(host=host, user=user, database=database, password=password, charset='utf8mb4', autocommit=True)
+
+
+def run_benchmark(catalog_options: dict, latency: float = 0.0, jitter: float = 0.0, max_per_host: int = 8, max_workers: int = 32, batch_size: int = 500,
+                  claim_batch_size: int = 16, max_page_size: int = 500, locales: dict = None, project_files_dir: str = None, db_host: str = 'localhost', db_user: str = 'root', db_password: str = 'actowiz',
+                  database: str = 'baslerweb_bench', database_backend: str = 'sqlite', port: int = 0) -> dict:
+    # One end to end Scraper.scrape() against a simulator process (catalog_options: SimulatedCatalog arguments), into a fresh database
+    # database_backend 'sqlite' is an in-memory stand-in (mysql_stand_in), 'mysql' a live server
+    if database_backend == 'mysql':
+        connection = fresh_database(host=db_host, user=db_user, password=db_password, database=database)
+    else:
+        connection = mysql_stand_in.connect()
+    with SimulatorProcess(catalog_options=catalog_options, latency=latency, jitter=jitter, port=port) as simulator:
+        scraper = Scraper(base_url=simulator.base_url, max_per_host=max_per_host, max_workers=max_workers, batch_size=batch_size, claim_batch_size=claim_batch_size,
+                          max_page_size=max_page_size, locales=locales, log_level='WARNING', connection=connection, project_files_dir=project_files_dir)
+        started = time.monotonic()
+        scraper.scrape()
+        wall_seconds = time.monotonic() - started
+        simulator_stats = simulator.stats()
+    requests_served = simulator_stats['requests']
+    bytes_served = simulator_stats['response_bytes']
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM products_links WHERE is_deleted = 0;')
+        product_count = cursor.fetchone()[0]
+    connection.close()
+    summary = metrics.summary()
+    rows_written = summary['stages'].get('db_write', dict()).get('rows_total', 0)
+    return {'wall_seconds': round(wall_seconds, 3), 'requests': requests_served, 'requests_per_second': round(requests_served / wall_seconds, 2),
+            'response_bytes': bytes_served, 'rows_written': rows_written, 'rows_per_second': round(rows_written / wall_seconds, 2),
+            'products_links': product_count, 'expected_products': simulator_stats['total_products'] * len(locales or [None]), 'peak_rss_mb': peak_rss_mb(), 'stages': summary['stages']}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark Scraper.scrape() against a local Basler / Magento API simulator running in its own process. '
+                                                 'Writes to an in-memory SQLite stand-in by default, --database-backend mysql needs a live MySQL server where '
+                                                 '--db-user may DROP and CREATE the --database, which is recreated for every run.')
+    parser.add_argument('--main-categories', type=int, default=5, help='At most 7, like the real nav')
+    parser.add_argument('--sub-categories', type=int, default=3, help='Sub categories per main category')
+    parser.add_argument('--product-categories', type=int, default=4, help='Product categories per sub category')
+    parser.add_argument('--products-per-category', type=int, default=60, help='Average products per product category')
+    parser.add_argument('--server-page-size', type=int, default=100, help='Largest magento page size the simulator serves')
+    parser.add_argument('--max-page-size', type=int, default=500, help='Page size the crawler asks for before it finds the server cap')
+    parser.add_argument('--locales', default='en-us:amer_en', help='Comma separated locale:store pairs crawled in one run')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the simulator waits before every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    parser.add_argument('--max-per-host', type=int, default=8)
+    parser.add_argument('--max-workers', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=500, help='Rows per products_links insert')
+    parser.add_argument('--claim-batch-size', type=int, default=16, help='Frontier categories claimed at a time')
+    parser.add_argument('--runs', type=int, default=1, help='Runs in a row, each into a fresh database')
+    parser.add_argument('--warm-cache', action='store_true', help='Keep the response cache between runs, runs after the first measure cache hits')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic catalog')
+    parser.add_argument('--database-backend', choices=['sqlite', 'mysql'], default='sqlite', help='In-memory SQLite stand-in, or a live MySQL server')
+    parser.add_argument('--db-host', default='localhost')
+    parser.add_argument('--db-user', default='root', help='Needs DROP / CREATE DATABASE rights on --database')
+    parser.add_argument('--db-password', default='actowiz')
+    parser.add_argument('--database', default='baslerweb_bench', help='Dropped and recreated for every run, never point it at baslerweb_db')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+    arguments = parser.parse_args()
+    if arguments.database_backend == 'mysql' and arguments.database == 'baslerweb_db':
+        parser.error('--database would drop the production database')
+
+    catalog_options = {'main_categories': arguments.main_categories, 'sub_categories': arguments.sub_categories, 'product_categories': arguments.product_categories,
+                       'products_per_category': arguments.products_per_category, 'max_page_size': arguments.server_page_size, 'seed': arguments.seed}
+    results = list()
+    simulator_port = free_port()  # Same urls in every run, so --warm-cache runs hit the cache of the first
+    cache_dir = tempfile.mkdtemp(prefix='basler_bench_')
+    try:
+        for run_no in range(1, arguments.runs + 1):
+            if not arguments.warm_cache and run_no > 1:
+                shutil.rmtree(cache_dir)
+                cache_dir = tempfile.mkdtemp(prefix='basler_bench_')
+            result = run_benchmark(catalog_options=catalog_options, latency=arguments.latency, jitter=arguments.jitter, max_per_host=arguments.max_per_host, max_workers=arguments.max_workers,
+                                   batch_size=arguments.batch_size, claim_batch_size=arguments.claim_batch_size,
+                                   max_page_size=arguments.max_page_size, locales=dict(pair.split(':', 1) for pair in arguments.locales.split(',')), project_files_dir=cache_dir, db_host=arguments.db_host,
+                                   db_user=arguments.db_user, db_password=arguments.db_password, database=arguments.database,
+                                   database_backend=arguments.database_backend, port=simulator_port)
+            results.append(result)
+            print(f'Run {run_no}: {result["wall_seconds"]}s wall, {result["requests"]} requests ({result["requests_per_second"]}/s), '
+                  f'{result["rows_written"]} rows ({result["rows_per_second"]}/s), {result["products_links"]}/{result["expected_products"]} products, peak RSS {result["peak_rss_mb"]} MB')
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    if arguments.output is not None:
+        with open(arguments.output, 'w', encoding='UTF-8') as file:
+            json.dump({'arguments': vars(arguments), 'runs': results}, file, indent=4)
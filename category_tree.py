@@ -0,0 +1,36 @@
+from sql_queries import main_cat_upsert_query, sub_cat_upsert_query, prod_cat_upsert_query
+
+
+class CategoryTree:
+    """Keeps main_categories_links -> sub_categories_links -> product_categories_links in sync and maps links to row ids."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.main_category_ids = dict()  # main category link -> id
+        self.sub_category_ids = dict()  # sub category link -> id
+        self.product_category_ids = dict()  # product category link -> id
+
+    def _fetch_ids(self, cursor, table: str, link_column: str, links: list) -> dict:
+        if not links:
+            return dict()
+        cursor.execute(f'SELECT id, {link_column} FROM {table} WHERE {link_column} IN %s;', (links,))
+        return {link: row_id for row_id, link in cursor.fetchall()}
+
+    def store(self, main_categories: list, sub_categories: list, prod_categories: list):
+        # main_categories: [(name, link)], sub_categories: [(name, link, main link)], prod_categories: [(name, link, sub link)]
+        # Names and parents may be None, existing values are kept for them
+        with self.connection.cursor() as cursor:
+            if main_categories:
+                cursor.executemany(main_cat_upsert_query, main_categories)
+            self.main_category_ids.update(self._fetch_ids(cursor, 'main_categories_links', 'main_category_link', list({link for _, link in main_categories})))
+            if sub_categories:
+                cursor.executemany(sub_cat_upsert_query, [(name, link, self.main_category_ids.get(main_link)) for name, link, main_link in sub_categories])
+            self.sub_category_ids.update(self._fetch_ids(cursor, 'sub_categories_links', 'sub_category_link', list({link for _, link, _ in sub_categories})))
+            if prod_categories:
+                cursor.executemany(prod_cat_upsert_query, [(name, link, self.sub_category_ids.get(sub_link)) for name, link, sub_link in prod_categories])
+            self.product_category_ids.update(self._fetch_ids(cursor, 'product_categories_links', 'product_category_link', list({link for _, link, _ in prod_categories})))
+
+    def set_category_id(self, prod_cat_link: str, category_id: str):
+        # Records the magento category id resolved for a product category
+        with self.connection.cursor() as cursor:
+            cursor.execute('UPDATE product_categories_links SET category_id = %s WHERE product_category_link = %s;', (category_id, prod_cat_link))
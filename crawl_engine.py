@@ -0,0 +1,36 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+class AsyncFetcher:
+    """Runs blocking page fetchers (page_checker / page_checker_json) concurrently with a per-host limit."""
+
+    def __init__(self, max_per_host: int = 8, max_workers: int = 32):
+        self.max_per_host = max_per_host  # Maximum number of in-flight requests for a single host
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetcher')
+        self._host_semaphores = dict()  # Host -> asyncio.Semaphore, created lazily inside the running loop
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        # One semaphore per host, so a slow host cannot starve the others
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def fetch(self, fetch_func, url: str, **kwargs):
+        # Run the blocking fetch function in the thread pool while holding the host's slot
+        async with self._host_semaphore(url=url):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(fetch_func, url=url, **kwargs))
+
+    async def fetch_all(self, fetch_func, urls: list, **kwargs) -> list:
+        # Fetch every url concurrently, results are returned in the same order as the urls
+        return await asyncio.gather(*(self.fetch(fetch_func, url=url, **kwargs) for url in urls))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self._host_semaphores.clear()
@@ -0,0 +1,104 @@
+import os
+import socket
+import uuid
+
+from crawl_metrics import logger
+from sql_queries import (frontier_seed_query, frontier_pages_query, frontier_claim_query,
+                         frontier_claimed_query, frontier_release_expired_query, main_cat_status_query, sub_cat_status_query)
+
+
+class CrawlFrontier:
+    """Persistent crawl frontier in MySQL (main_categories_links -> sub_categories_links -> crawl_frontier rows).
+
+    Product categories are the unit of work: a worker claims pending ones atomically, so several processes
+    can share the same tables. Status goes pending -> in-progress -> done, or back to pending on failure
+    until max_attempts is reached, then failed. A failed category waits retry_seconds (times its attempts) before it can be claimed again. Claims of crashed workers return to pending once their lease expires;
+    live workers renew their lease with heartbeat(), and a worker restarted with the same worker_id takes its old claims back at once.
+    A worker only seeds, resets and claims the rows of its own locales.
+    """
+
+    def __init__(self, connection, worker_id: str = None, lease_seconds: int = 300, max_attempts: int = 3, retry_seconds: int = 30, locales: list = ('en-us',)):
+        self.connection = connection
+        self.locales = list(locales)
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+
+    def _execute(self, query: str, args=None) -> int:
+        with self.connection.cursor() as cursor:
+            return cursor.execute(query, args)
+
+    def seed(self, prod_categories: list, resume: bool = True):
+        # Registers the product categories of the nav tree, existing rows keep their status so a restart resumes where the last run stopped
+        # Open rows are counted before the nav rows go in: new nav entries alone must not turn a finished crawl into a "resumed" one
+        with self.connection.cursor() as cursor:
+            self._execute(frontier_release_expired_query, (self.lease_seconds,))
+            # Claims still held under this worker id belong to a previous process that died
+            self._execute("UPDATE crawl_frontier SET link_status = 'pending', claimed_by = NULL WHERE claimed_by = %s AND link_status = 'in-progress';", (self.worker_id,))
+            cursor.execute("SELECT COUNT(*) FROM crawl_frontier WHERE page_no = 0 AND link_status IN ('pending', 'in-progress') AND locale IN %s;", (self.locales,))
+            open_count = cursor.fetchone()[0]
+            if not resume or open_count == 0:
+                # Nothing left from the previous crawl (or a fresh crawl was asked for), start a new one
+                logger.info('Starting a new crawl frontier for %s', ', '.join(self.locales))
+                self._execute("UPDATE crawl_frontier SET link_status = 'pending', claimed_by = NULL, claimed_at = NULL, attempts = 0, retry_at = NULL WHERE locale IN %s;", (self.locales,))
+            else:
+                logger.info('Resuming crawl frontier, %s product categories left', open_count)
+            cursor.executemany(frontier_seed_query, [(prod_category['main_cat_link'], prod_category['sub_cat_link'], prod_category['prod_cat_link'], prod_category['locale'])
+                                                     for prod_category in prod_categories])
+        self.update_parents()
+
+    def claim(self, batch_size: int) -> list:
+        # Atomically takes up to batch_size pending product categories for this worker, after returning the claims of dead workers
+        self._execute(frontier_release_expired_query, (self.lease_seconds,))
+        self._execute(frontier_claim_query, (self.worker_id, self.locales, batch_size))
+        with self.connection.cursor() as cursor:
+            cursor.execute(frontier_claimed_query, (self.worker_id,))
+            claimed_rows = cursor.fetchall()
+        return [{'frontier_id': frontier_id, 'main_cat_link': main_cat_link, 'sub_cat_link': sub_cat_link, 'prod_cat_link': prod_cat_link, 'locale': locale}
+                for frontier_id, main_cat_link, sub_cat_link, prod_cat_link, locale in claimed_rows]
+
+    def heartbeat(self):
+        # Renews the lease of every category this worker is still crawling
+        self._execute("UPDATE crawl_frontier SET claimed_at = CURRENT_TIMESTAMP WHERE claimed_by = %s AND link_status = 'in-progress';", (self.worker_id,))
+
+    def add_pages(self, prod_category: dict, category_id: str, page_count: int, page_size: int):
+        # Page rows planned with another page size or beyond the new page count cover other products, they are planned again
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM crawl_frontier WHERE prod_category_link = %s AND category_id = %s AND page_no > 0 AND (page_size <> %s OR page_no > %s);',
+                           (prod_category['prod_cat_link'], category_id, page_size, page_count))
+            cursor.executemany(frontier_pages_query, [(prod_category['main_cat_link'], prod_category['sub_cat_link'], prod_category['prod_cat_link'], category_id, page_no, page_size,
+                                                       prod_category['locale'])
+                                                      for page_no in range(1, page_count + 1)])
+
+    def done_pages(self, prod_category: dict, category_id: str, page_size: int) -> set:
+        # Pages stored by an earlier (interrupted) attempt with the same page size, their rows do not have to be written again
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT page_no FROM crawl_frontier WHERE prod_category_link = %s AND category_id = %s AND page_no > 0 AND page_size = %s AND link_status = 'done';",
+                           (prod_category['prod_cat_link'], category_id, page_size))
+            return {row[0] for row in cursor.fetchall()}
+
+    def mark_pages_done(self, prod_category: dict, category_id: str, page_nos: list):
+        if page_nos:
+            self._execute("UPDATE crawl_frontier SET link_status = 'done' WHERE prod_category_link = %s AND category_id = %s AND page_no IN %s;",
+                          (prod_category['prod_cat_link'], category_id, list(page_nos)))
+
+    def finish(self, prod_category: dict):
+        self._execute("UPDATE crawl_frontier SET link_status = 'done' WHERE id = %s;", (prod_category['frontier_id'],))
+
+    def fail(self, prod_category: dict):
+        self._execute("""UPDATE crawl_frontier SET link_status = IF(attempts >= %s, 'failed', 'pending'), claimed_by = NULL,
+                         retry_at = CURRENT_TIMESTAMP + INTERVAL attempts * %s SECOND WHERE id = %s;""",
+                      (self.max_attempts, self.retry_seconds, prod_category['frontier_id']))
+
+    def next_retry_seconds(self) -> int or None:
+        # Seconds until the next failed product category of this worker's locales can be claimed again, None when none is waiting
+        with self.connection.cursor() as cursor:
+            cursor.execute("""SELECT TIMESTAMPDIFF(SECOND, CURRENT_TIMESTAMP, MIN(retry_at)) FROM crawl_frontier
+                              WHERE link_status = 'pending' AND page_no = 0 AND locale IN %s AND retry_at > CURRENT_TIMESTAMP;""", (self.locales,))
+            retry_seconds = cursor.fetchone()[0]
+        return None if retry_seconds is None else max(int(retry_seconds), 1)
+
+    def update_parents(self):
+        self._execute(sub_cat_status_query)
+        self._execute(main_cat_status_query)
@@ -0,0 +1,152 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('basler_web')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Seconds, Prometheus style upper bounds
+
+
+def configure_logging(level: str = 'INFO'):
+    # INFO shows progress per category / batch, DEBUG adds one line per request and per nav entry
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value: float):
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[index] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def cumulative_buckets(self) -> list:
+        # [(upper bound label, observations <= bound)] as Prometheus expects them
+        cumulative = 0
+        labels = [str(bound) for bound in self.buckets] + ['+Inf']
+        result = list()
+        for label, bucket_count in zip(labels, self.bucket_counts):
+            cumulative += bucket_count
+            result.append((label, cumulative))
+        return result
+
+    def quantile(self, q: float) -> float or None:
+        # Upper bound of the bucket holding the q-th observation, good enough to spot the slow stage
+        if not self.count:
+            return None
+        for label, cumulative in self.cumulative_buckets():
+            if cumulative >= q * self.count:
+                return self.maximum if label == '+Inf' else min(float(label), self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'sum': round(self.total, 6), 'mean': round(self.total / self.count, 6) if self.count else None,
+                'p50': round(self.quantile(0.5), 6) if self.count else None, 'p95': round(self.quantile(0.95), 6) if self.count else None, 'max': round(self.maximum, 6)}
+
+
+class CrawlMetrics:
+    """Thread-safe per-stage metrics of a crawl: request latency / bytes, cache hits, DB write latency and rows.
+
+    Stages are the cache namespaces ('Main_Page', 'Category_id_jsons', 'Product_Pages', ...) plus 'db_write'.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.histograms = dict()  # (metric, stage) -> Histogram
+            self.counters = dict()  # (metric, stage) -> number
+            self.stage_windows = dict()  # stage -> [first event, last event] (monotonic)
+
+    def _touch(self, stage: str, started: float, finished: float):
+        window = self.stage_windows.setdefault(stage, [started, finished])
+        window[0] = min(window[0], started)
+        window[1] = max(window[1], finished)
+
+    def observe(self, metric: str, stage: str, value: float, started: float = None):
+        now = time.monotonic()
+        with self._lock:
+            self.histograms.setdefault((metric, stage), Histogram()).observe(value)
+            self._touch(stage=stage, started=started if started is not None else now - value, finished=now)
+
+    def increment(self, metric: str, stage: str, amount: float = 1):
+        with self._lock:
+            self.counters[(metric, stage)] = self.counters.get((metric, stage), 0) + amount
+
+    @contextmanager
+    def timer(self, metric: str, stage: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(metric=metric, stage=stage, value=time.monotonic() - started, started=started)
+
+    def record_request(self, stage: str, seconds: float, size: int):
+        self.observe(metric='request_latency_seconds', stage=stage, value=seconds)
+        self.increment(metric='requests_total', stage=stage)
+        self.increment(metric='response_bytes_total', stage=stage, amount=size)
+
+    def record_cache(self, stage: str, hit: bool):
+        self.increment(metric='cache_hits_total' if hit else 'cache_misses_total', stage=stage)
+
+    def record_rows(self, stage: str, rows: int):
+        self.increment(metric='rows_total', stage=stage, amount=rows)
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = sorted({stage for _, stage in self.histograms} | {stage for _, stage in self.counters})
+            summary = {'started_at': self.started_at, 'wall_seconds': round(time.time() - self.started_at, 3), 'stages': dict()}
+            for stage in stages:
+                stage_summary = {metric: value for (metric, metric_stage), value in self.counters.items() if metric_stage == stage}
+                stage_summary.update({metric: histogram.to_dict() for (metric, metric_stage), histogram in self.histograms.items() if metric_stage == stage})
+                hits, misses = stage_summary.get('cache_hits_total', 0), stage_summary.get('cache_misses_total', 0)
+                if hits + misses:
+                    stage_summary['cache_hit_ratio'] = round(hits / (hits + misses), 4)
+                window = self.stage_windows.get(stage)
+                if window is not None and window[1] > window[0]:
+                    stage_summary['active_seconds'] = round(window[1] - window[0], 3)
+                    if 'rows_total' in stage_summary:
+                        stage_summary['rows_per_second'] = round(stage_summary['rows_total'] / (window[1] - window[0]), 2)
+                summary['stages'][stage] = stage_summary
+        return summary
+
+    def to_prometheus(self) -> str:
+        lines = list()
+        with self._lock:
+            for (metric, stage), value in sorted(self.counters.items()):
+                lines.append(f'basler_web_{metric}{{stage="{stage}"}} {value}')
+            for (metric, stage), histogram in sorted(self.histograms.items()):
+                for label, cumulative in histogram.cumulative_buckets():
+                    lines.append(f'basler_web_{metric}_bucket{{stage="{stage}",le="{label}"}} {cumulative}')
+                lines.append(f'basler_web_{metric}_sum{{stage="{stage}"}} {histogram.total}')
+                lines.append(f'basler_web_{metric}_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def emit(self, path: str = None, output_format: str = 'json') -> str:
+        # Writes the end of run summary to path (or only to the log) as JSON or Prometheus text
+        text = self.to_prometheus() if output_format == 'prometheus' else json.dumps(self.summary(), indent=4)
+        if path is not None:
+            with open(path, 'w', encoding='UTF-8') as file:
+                file.write(text)
+        logger.info('Crawl metrics:\n%s', text)
+        return text
+
+
+metrics = CrawlMetrics()  # Shared by the fetch threads, the writers and the Scraper
@@ -0,0 +1,109 @@
+import hashlib
+import json
+
+from crawl_metrics import logger
+from sql_queries import category_state_upsert_query, category_ids_upsert_query
+
+
+def page_hash(response_dict: dict) -> str:
+    # Hash of the products of a magento page, independent of key order and of the other response fields
+    items = response_dict.get('items') or list()
+    return hashlib.sha256(json.dumps(items, sort_keys=True).encode('UTF-8')).hexdigest()
+
+
+class CategoryStateStore:
+    """Last seen total_count, page hashes and product links of every magento category per locale (category_crawl_state table, keyed '<locale>:<category id>')."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.states = dict()
+
+    def load(self) -> dict:
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT category_id, total_count, page_hashes, product_links, pending_removals FROM category_crawl_state;')
+            for category_id, total_count, page_hashes, product_links, pending_removals in cursor.fetchall():
+                self.states[category_id] = {'total_count': total_count, 'page_hashes': json.loads(page_hashes or '[]'), 'product_links': json.loads(product_links or '[]'),
+                                            'pending_removals': json.loads(pending_removals or '[]')}
+        logger.info('Loaded crawl state of %s categories', len(self.states))
+        return self.states
+
+    def get(self, category_id: str) -> dict or None:
+        return self.states.get(category_id)
+
+    def save(self, category_id: str, total_count: int, page_hashes: list, product_links: list, removed_links: set = ()):
+        # removed_links are stored as pending removals in the same row, until clear_pending_removals() once their tombstones are written
+        old_state = self.states.get(category_id)
+        pending_removals = sorted(set(removed_links) | set(old_state['pending_removals'] if old_state is not None else list()))
+        self.states[category_id] = {'total_count': total_count, 'page_hashes': page_hashes, 'product_links': product_links, 'pending_removals': pending_removals}
+        with self.connection.cursor() as cursor:
+            cursor.execute(category_state_upsert_query, (category_id, total_count, json.dumps(page_hashes), json.dumps(product_links), json.dumps(pending_removals) if pending_removals else None))
+
+    def live_links(self, locales: list) -> set:
+        # Product links of the last complete crawl of every category of the locales, read from the Database so categories
+        # stored by other workers or by an interrupted earlier run count too
+        live_links = set()
+        with self.connection.cursor() as cursor:
+            for locale in locales:
+                cursor.execute('SELECT product_links FROM category_crawl_state WHERE category_id LIKE %s;', (f'{locale}:%',))
+                for product_links, in cursor.fetchall():
+                    live_links.update(json.loads(product_links or '[]'))
+        return live_links
+
+    def pending_removals(self) -> set:
+        # Removals saved by this or an interrupted earlier run whose tombstones may not be written yet
+        return {product_link for state in self.states.values() for product_link in state['pending_removals']}
+
+    def clear_pending_removals(self):
+        category_ids = [category_id for category_id, state in self.states.items() if state['pending_removals']]
+        if not category_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute('UPDATE category_crawl_state SET pending_removals = NULL WHERE category_id IN %s;', (category_ids,))
+        for category_id in category_ids:
+            self.states[category_id]['pending_removals'] = list()
+
+
+class CategoryIdStore:
+    """Magento category ids resolved from the contentful API per locale and nav slug (category_slug_ids table, keyed '<locale>:<slug>').
+
+    Entries older than max_age seconds are not loaded, so their slugs are resolved again; invalidate() drops one right away.
+    """
+
+    def __init__(self, connection, max_age: float = 7 * 24 * 3600):
+        self.connection = connection
+        self.max_age = max_age
+        self.category_ids = dict()  # '<locale>:<slug>' -> [category id]
+        self.invalidated = set()  # Slugs whose cached contentful response is stale too, revalidated when resolved again
+
+    def load(self) -> dict:
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT slug, category_ids FROM category_slug_ids WHERE resolved_at > CURRENT_TIMESTAMP - INTERVAL %s SECOND;', (int(self.max_age),))
+            for slug, category_ids in cursor.fetchall():
+                self.category_ids[slug] = json.loads(category_ids or '[]')
+        logger.info('Loaded category ids of %s slugs', len(self.category_ids))
+        return self.category_ids
+
+    def get(self, slug: str) -> list or None:
+        return self.category_ids.get(slug)
+
+    def missing(self, slugs: list) -> list:
+        # Slugs without a usable entry, in their original order
+        return [slug for slug in dict.fromkeys(slugs) if slug not in self.category_ids]
+
+    def save(self, resolved: dict):
+        # resolved: {slug: [category id]}
+        if not resolved:
+            return
+        self.category_ids.update(resolved)
+        self.invalidated.difference_update(resolved)
+        with self.connection.cursor() as cursor:
+            cursor.executemany(category_ids_upsert_query, [(slug, json.dumps(category_ids)) for slug, category_ids in resolved.items()])
+
+    def invalidate(self, slug: str):
+        # Called when a cached id leads nowhere, the slug is resolved again before the category is retried
+        self.invalidated.add(slug)
+        if self.category_ids.pop(slug, None) is None:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM category_slug_ids WHERE slug = %s;', (slug,))
+        logger.info('Invalidated category ids of %s', slug)
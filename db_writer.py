@@ -0,0 +1,196 @@
+import json
+
+from crawl_metrics import logger, metrics
+from sql_queries import (main_cat_query, sub_cat_query, sub_cat_new_columns, sub_cat_main_fk, prod_cat_query, products_query, products_new_columns,
+                         product_category_products_query, product_details_query, product_details_upsert_query, category_state_query, category_state_new_columns, category_ids_query,
+                         frontier_query, frontier_new_columns,
+                         products_upsert_query, products_ids_query, product_category_products_insert_query, products_tombstone_query)
+
+
+def ensure_columns(cursor, table: str, columns: dict):
+    # Adds the columns missing from an existing table (CREATE TABLE IF NOT EXISTS leaves old tables untouched)
+    cursor.execute('SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s;', (table,))
+    existing_columns = {row[0] for row in cursor.fetchall()}
+    for column, definition in columns.items():
+        if column not in existing_columns:
+            cursor.execute(f'ALTER TABLE `{table}` ADD COLUMN `{column}` {definition};')
+            logger.info('Added column %s to %s', column, table)
+
+
+def ensure_index(cursor, table: str, index_name: str, definition: str):
+    # Adds an index / unique key to an existing table unless an index with that name is already there
+    cursor.execute('SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s;', (table, index_name))
+    if cursor.fetchone() is None:
+        cursor.execute(f'ALTER TABLE `{table}` ADD {definition};')
+        logger.info('Added index %s to %s', index_name, table)
+
+
+def create_tables(cursor):
+    # Creating the crawler tables if they do not exist and upgrading tables created by older versions
+    try:
+        cursor.execute(query=main_cat_query)
+        ensure_index(cursor=cursor, table='main_categories_links', index_name='main_category_link_unique', definition='UNIQUE KEY main_category_link_unique (main_category_link)')
+    except Exception as e:
+        logger.error(e)
+    try:
+        cursor.execute(query=sub_cat_query)
+        ensure_index(cursor=cursor, table='sub_categories_links', index_name='sub_category_link_unique', definition='UNIQUE KEY sub_category_link_unique (sub_category_link)')
+        ensure_columns(cursor=cursor, table='sub_categories_links', columns=sub_cat_new_columns)
+        ensure_index(cursor=cursor, table='sub_categories_links', index_name='fk_sub_category_main', definition=sub_cat_main_fk)
+    except Exception as e:
+        logger.error(e)
+    try:
+        cursor.execute(query=prod_cat_query)
+    except Exception as e:
+        logger.error(e)
+    try:
+        cursor.execute(query=products_query)
+        ensure_columns(cursor=cursor, table='products_links', columns=products_new_columns)
+        ensure_index(cursor=cursor, table='products_links', index_name='products_links_locale', definition='KEY products_links_locale (locale)')
+        # Incremental exports filter on these two timestamps
+        ensure_index(cursor=cursor, table='products_links', index_name='products_links_updated_at', definition='KEY products_links_updated_at (updated_at)')
+    except Exception as e:
+        logger.error(e)
+    try:
+        cursor.execute(query=product_category_products_query)
+        ensure_index(cursor=cursor, table='product_category_products', index_name='product_category_products_created_at',
+                     definition='KEY product_category_products_created_at (created_at)')
+    except Exception as e:
+        logger.error(e)
+    try:
+        cursor.execute(query=product_details_query)
+    except Exception as e:
+        logger.error(e)
+    try:
+        cursor.execute(query=category_state_query)
+        ensure_columns(cursor=cursor, table='category_crawl_state', columns=category_state_new_columns)
+    except Exception as e:
+        logger.error(e)
+    try:
+        cursor.execute(query=category_ids_query)
+    except Exception as e:
+        logger.error(e)
+    try:
+        cursor.execute(query=frontier_query)
+        ensure_columns(cursor=cursor, table='crawl_frontier', columns=frontier_new_columns)
+    except Exception as e:
+        logger.error(e)
+
+
+class ProductLinkWriter:
+    """Buffers product rows and writes them to products_links (+ their product_category_products links) in batches, one transaction per batch."""
+
+    def __init__(self, connection, batch_size: int = 500):
+        self.connection = connection
+        self.batch_size = batch_size
+        self._rows = dict()  # product_link -> set of product category ids, also drops duplicate products inside a batch
+        self._locales = dict()  # product_link -> locale of the store it was found in
+        self._tombstones = set()  # product links that disappeared from their category
+        self.rows_written = 0
+
+    def add(self, product_link: str, product_category_id: int = None, locale: str = 'en-us'):
+        self._locales[product_link] = locale
+        product_category_ids = self._rows.setdefault(product_link, set())
+        if product_category_id is not None:
+            product_category_ids.add(product_category_id)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows = list(self._rows.items())
+        locales = self._locales
+        self._rows.clear()
+        self._locales = dict()
+        product_links = [product_link for product_link, _ in rows]
+        # pymysql turns executemany on a single INSERT ... VALUES into one multi-row statement
+        self.connection.begin()
+        try:
+            with metrics.timer(metric='db_write_seconds', stage='db_write'), self.connection.cursor() as cursor:
+                cursor.executemany(products_upsert_query, [(product_link, locales[product_link]) for product_link in product_links])
+                cursor.execute(products_ids_query, (product_links,))
+                product_ids = {product_link: product_id for product_id, product_link in cursor.fetchall()}
+                category_links = [(product_category_id, product_ids[product_link]) for product_link, product_category_ids in rows for product_category_id in product_category_ids]
+                if category_links:
+                    cursor.executemany(product_category_products_insert_query, category_links)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        self.rows_written += len(rows)
+        metrics.record_rows(stage='db_write', rows=len(rows))
+        logger.info('Stored %s product links into Database', len(rows))
+
+    def tombstone(self, product_links):
+        # Marks products as deleted on the next flush_tombstones (rows are kept, so exports can report them)
+        self._tombstones.update(product_links)
+
+    def flush_tombstones(self, keep_links: set = None):
+        # keep_links: links seen elsewhere in this run, e.g. a product that only moved to another category
+        tombstones = self._tombstones - (keep_links or set())
+        self._tombstones.clear()
+        if not tombstones:
+            return
+        tombstones = sorted(tombstones)
+        self.connection.begin()
+        try:
+            with self.connection.cursor() as cursor:
+                for start in range(0, len(tombstones), self.batch_size):
+                    cursor.execute(products_tombstone_query, (tombstones[start:start + self.batch_size],))
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        logger.info('Marked %s product links as deleted', len(tombstones))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ProductDetailWriter:
+    """Buffers parsed product details and upserts them into the products table in batches."""
+
+    def __init__(self, connection, batch_size: int = 200):
+        self.connection = connection
+        self.batch_size = batch_size
+        self._rows = list()
+        self.rows_written = 0
+
+    def add(self, product_id: int, details: dict):
+        self._rows.append((product_id, details.get('sku'), details.get('product_name'), details.get('price'), details.get('currency'), details.get('availability'),
+                           json.dumps(details.get('details'), ensure_ascii=False)))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows = self._rows
+        self._rows = list()
+        self.connection.begin()
+        try:
+            with metrics.timer(metric='db_write_seconds', stage='product_details_write'), self.connection.cursor() as cursor:
+                cursor.executemany(product_details_upsert_query, rows)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        self.rows_written += len(rows)
+        metrics.record_rows(stage='product_details_write', rows=len(rows))
+        logger.info('Stored details of %s products into Database', len(rows))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,67 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (10, 60)  # (connect, read) timeout in seconds
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host so that at most `requests_per_second` are started per host."""
+
+    def __init__(self, requests_per_second: float = 0):
+        self.interval = 1 / requests_per_second if requests_per_second else 0  # 0 disables rate limiting
+        self._next_slot = dict()  # Host -> monotonic time at which the next request may start
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        # Reserve the next free slot for this host, then sleep outside the lock until it comes
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_session = None
+_session_lock = threading.Lock()
+_rate_limiter = HostRateLimiter()
+_timeout = DEFAULT_TIMEOUT
+
+
+def configure_http(pool_maxsize: int = 32, total_retries: int = 5, backoff_factor: float = 0.5, timeout: tuple = DEFAULT_TIMEOUT, requests_per_second: float = 0):
+    # (Re)builds the shared session: keep-alive pool per host, retries with exponential backoff on 429/5xx
+    global _session, _rate_limiter, _timeout
+    retry = Retry(total=total_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES, respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = session
+        _rate_limiter = HostRateLimiter(requests_per_second=requests_per_second)
+        _timeout = timeout
+    return session
+
+
+def get_session() -> requests.Session:
+    # Returns the shared session, creating it with the default settings on first use
+    if _session is None:
+        configure_http()
+    return _session
+
+
+def send_request(method: str, url: str, **kwargs) -> requests.Response:
+    _rate_limiter.wait(url=url)
+    kwargs.setdefault('timeout', _timeout)
+    return get_session().request(method=method, url=url, **kwargs)
@@ -0,0 +1,74 @@
+import argparse
+import json
+
+import pymysql
+
+from category_tree import CategoryTree
+from db_writer import create_tables
+from sql_queries import product_category_products_insert_query
+
+
+def metadata_lineage(product_link: str, metadata: str) -> tuple:
+    # Returns (main link, sub link, product category link) from the old metadata list of single-key dicts
+    lineage = dict()
+    for level in json.loads(metadata):
+        lineage.update(level)
+    main_cat_link = lineage.get('main category link')
+    sub_cat_link = lineage.get('Sub category link')
+    prod_cat_link = lineage.get('Prod category link')
+    if prod_cat_link in (None, 'N/A'):
+        prod_cat_link = product_link  # Shop links were stored without a product category, they are their own product category now
+        if sub_cat_link == main_cat_link:
+            sub_cat_link = None  # Older shop rows recorded the main category as sub category, the next crawl fills the real one in
+    return main_cat_link, sub_cat_link, prod_cat_link
+
+
+def migrate_metadata(connection, chunk_size: int = 1000, drop_metadata: bool = False) -> int:
+    # Moves the lineage of the metadata JSON column into the category tables + product_category_products, chunk by chunk
+    category_tree = CategoryTree(connection=connection)
+    migrated_count = 0
+    last_id = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, product_link, metadata FROM products_links WHERE id > %s AND metadata IS NOT NULL ORDER BY id LIMIT %s;', (last_id, chunk_size))
+            rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        product_lineages = [(product_id, metadata_lineage(product_link=product_link, metadata=metadata)) for product_id, product_link, metadata in rows]
+        lineages = {lineage for _, lineage in product_lineages}
+        category_tree.store(main_categories=[(None, main_cat_link) for main_cat_link in {lineage[0] for lineage in lineages if lineage[0]}],
+                            sub_categories=[(None, sub_cat_link, main_cat_link) for main_cat_link, sub_cat_link in {lineage[:2] for lineage in lineages if lineage[1]}],
+                            prod_categories=[(None, prod_cat_link, sub_cat_link) for sub_cat_link, prod_cat_link in {lineage[1:] for lineage in lineages}])
+        connection.begin()
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(product_category_products_insert_query, [(category_tree.product_category_ids[lineage[2]], product_id) for product_id, lineage in product_lineages])
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        migrated_count += len(rows)
+        print(f'Migrated metadata of {migrated_count} products')
+    if drop_metadata:
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE products_links DROP COLUMN metadata;')
+        print('Dropped products_links.metadata')
+    return migrated_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate products_links.metadata into the normalized category tables')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--drop-metadata', action='store_true', help='Drop the metadata column once every row is migrated')
+    arguments = parser.parse_args()
+
+    # Creating a connection to SQL Database
+    connection = pymysql.connect(host='localhost', user='root', database='baslerweb_db', password='actowiz', charset='utf8mb4', autocommit=True)
+    if connection.open:
+        print('Database connection Successful!')
+    else:
+        print('Database connection Un-Successful.')
+    with connection.cursor() as cursor:
+        create_tables(cursor=cursor)
+    migrate_metadata(connection=connection, chunk_size=arguments.chunk_size, drop_metadata=arguments.drop_metadata)
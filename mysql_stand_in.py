@@ -0,0 +1,199 @@
+import re
+import sqlite3
+import threading
+
+# SQLite stand-in for the MySQL database, so the crawler / benchmark / tests run without a MySQL server.
+# It covers the MySQL dialect of sql_queries.py and of the modules writing to the crawler tables, not MySQL in general:
+# statements are rewritten to SQLite one by one (placeholders, upserts, INTERVAL arithmetic, UPDATE ... LIMIT, information_schema lookups).
+
+TABLE_KEY_PATTERN = re.compile(r',\s*(UNIQUE\s+)?KEY\s+(\w+)\s*\(([^)]*)\)', re.IGNORECASE)
+ON_UPDATE_PATTERN = re.compile(r'(\w+)\s+TIMESTAMP([^,]*?)\s+ON UPDATE CURRENT_TIMESTAMP', re.IGNORECASE)
+ALTER_ADD_KEY_PATTERN = re.compile(r'ALTER TABLE `?(\w+)`? ADD (UNIQUE )?KEY (\w+) \(([^)]*)\);?', re.IGNORECASE)
+ALTER_ADD_CONSTRAINT_PATTERN = re.compile(r'ALTER TABLE `?\w+`? ADD CONSTRAINT ', re.IGNORECASE)
+COLUMNS_QUERY_PATTERN = re.compile(r'SELECT COLUMN_NAME FROM information_schema\.COLUMNS', re.IGNORECASE)
+STATISTICS_QUERY_PATTERN = re.compile(r'SELECT 1 FROM information_schema\.STATISTICS', re.IGNORECASE)
+UPDATE_LIMIT_PATTERN = re.compile(r'UPDATE (\w+)\s+SET (.*?)\s+WHERE (.*?)\s+ORDER BY (.*?)\s+LIMIT (\S+?);?\s*$', re.IGNORECASE | re.DOTALL)
+INTERVAL_PATTERN = re.compile(r'CURRENT_TIMESTAMP\s*([+-])\s*INTERVAL\s+(.+?)\s+SECOND', re.IGNORECASE)
+TIMESTAMPDIFF_PATTERN = re.compile(r'TIMESTAMPDIFF\(SECOND,\s*(.+?),\s*(MIN\(\w+\)|\w+)\)', re.IGNORECASE)
+
+
+def expand_placeholders(query: str, args) -> tuple:
+    # %s -> ?, a list / tuple argument becomes (?, ?, ...) like pymysql renders it for IN %s
+    if args is None:
+        return query, ()
+    if not isinstance(args, (list, tuple)):
+        args = (args,)
+    parts = query.split('%s')
+    if len(parts) - 1 != len(args):
+        raise ValueError(f'{len(parts) - 1} placeholders for {len(args)} arguments: {query}')
+    flat_args = list()
+    expanded = [parts[0]]
+    for arg, part in zip(args, parts[1:]):
+        if isinstance(arg, (list, tuple, set)):
+            arg = list(arg)
+            expanded.append('(' + ', '.join('?' * len(arg)) + ')' if arg else '(NULL)')
+            flat_args.extend(arg)
+        else:
+            expanded.append('?')
+            flat_args.append(arg)
+        expanded.append(part)
+    return ''.join(expanded), tuple(flat_args)
+
+
+def translate_create_table(query: str) -> list:
+    # CREATE TABLE with inline KEY / UNIQUE KEY / ON UPDATE columns -> CREATE TABLE, CREATE INDEX and update triggers
+    table = re.search(r'CREATE TABLE IF NOT EXISTS (\w+)', query, re.IGNORECASE).group(1)
+    indexes = [f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON {table} ({columns});' for unique, name, columns in TABLE_KEY_PATTERN.findall(query)]
+    on_update_columns = [column for column, _ in ON_UPDATE_PATTERN.findall(query)]
+    query = TABLE_KEY_PATTERN.sub('', query)
+    query = ON_UPDATE_PATTERN.sub(r'\1 TIMESTAMP\2', query)
+    query = re.sub(r'\bINT AUTO_INCREMENT PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT', query, flags=re.IGNORECASE)
+    triggers = [f'''CREATE TRIGGER IF NOT EXISTS {table}_{column}_on_update AFTER UPDATE ON {table} FOR EACH ROW WHEN NEW.{column} IS OLD.{column}
+                    BEGIN UPDATE {table} SET {column} = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid; END;''' for column in on_update_columns]
+    return [query] + indexes + triggers
+
+
+def translate(query: str) -> str:
+    # Dialect rewrites of a single DML statement, placeholders are already '?'
+    query = re.sub(r'\bINSERT IGNORE\b', 'INSERT OR IGNORE', query, flags=re.IGNORECASE)
+    if re.search(r'ON DUPLICATE KEY UPDATE', query, re.IGNORECASE):
+        query = re.sub(r'ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET', query, flags=re.IGNORECASE)
+        query = re.sub(r'\bVALUES\((\w+)\)', r'excluded.\1', query, flags=re.IGNORECASE)
+    query = INTERVAL_PATTERN.sub(lambda match: f"datetime(CURRENT_TIMESTAMP, '{match.group(1)}' || ({match.group(2)}) || ' seconds')", query)
+    query = TIMESTAMPDIFF_PATTERN.sub(lambda match: f"(CAST(strftime('%s', {match.group(2)}) AS INTEGER) - CAST(strftime('%s', {match.group(1)}) AS INTEGER))", query)
+    query = re.sub(r'\bIF\(', 'IIF(', query)
+    query = re.sub(r'\bGREATEST\(', 'MAX(', query, flags=re.IGNORECASE)
+    query = re.sub(r'UPDATE (\w+) p SET', r'UPDATE \1 AS p SET', query)
+    update_limit = UPDATE_LIMIT_PATTERN.match(query.strip())
+    if update_limit is not None:
+        table, assignments, condition, order, limit = update_limit.groups()
+        query = f'UPDATE {table} SET {assignments} WHERE id IN (SELECT id FROM {table} WHERE {condition} ORDER BY {order} LIMIT {limit});'
+    return query
+
+
+class Cursor:
+    """pymysql-like cursor over a sqlite3 cursor, execute() returns the affected / selected row count."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._connection.cursor()
+        self._rows = None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self) -> int:
+        return len(self._rows) if self._rows is not None else self._cursor.rowcount
+
+    def _run(self, statement: str, args: tuple = ()):
+        self._cursor.execute(statement, args)
+
+    def execute(self, query: str, args=None) -> int:
+        with self.connection._lock:
+            self._rows = None
+            columns_query = COLUMNS_QUERY_PATTERN.match(query)
+            statistics_query = STATISTICS_QUERY_PATTERN.match(query)
+            if columns_query is not None or statistics_query is not None:
+                return self._schema_lookup(args=args, columns=columns_query is not None)
+            if re.match(r'\s*CREATE TABLE', query, re.IGNORECASE):
+                for statement in translate_create_table(query=query):
+                    self._run(statement)
+                return 0
+            alter_add_key = ALTER_ADD_KEY_PATTERN.match(query)
+            if alter_add_key is not None:
+                table, unique, name, columns = alter_add_key.groups()
+                self._run(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON {table} ({columns});')
+                return 0
+            if ALTER_ADD_CONSTRAINT_PATTERN.match(query):
+                return 0  # SQLite cannot add foreign keys to an existing table, they are not enforced anyway
+            statement, statement_args = expand_placeholders(query=query, args=args)
+            self._run(translate(query=statement), statement_args)
+            if self._cursor.description is not None:
+                self._rows = self._cursor.fetchall()
+                return len(self._rows)
+            return self._cursor.rowcount
+
+    def executemany(self, query: str, args) -> int:
+        affected = 0
+        for row_args in args:
+            affected += max(self.execute(query, row_args), 0)
+        return affected
+
+    def _schema_lookup(self, args, columns: bool) -> int:
+        # information_schema.COLUMNS / STATISTICS lookups of ensure_columns() / ensure_index()
+        table = args[0]
+        if columns:
+            self._rows = [(row[1],) for row in self._cursor.execute(f'PRAGMA table_info({table});').fetchall()]
+        else:
+            index_names = {row[1] for row in self._cursor.execute(f'PRAGMA index_list({table});').fetchall()}
+            self._rows = [(1,)] if args[1] in index_names else list()
+        return len(self._rows)
+
+    def fetchone(self):
+        if not self._rows:
+            return None
+        return self._rows.pop(0)
+
+    def fetchmany(self, size: int = 1) -> list:
+        rows, self._rows = (self._rows or list())[:size], (self._rows or list())[size:]
+        return rows
+
+    def fetchall(self) -> list:
+        rows, self._rows = self._rows or list(), list()
+        return rows
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class Connection:
+    """pymysql-like connection to a SQLite database (':memory:' by default), autocommit unless begin() is called."""
+
+    def __init__(self, database: str = ':memory:'):
+        self._connection = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()  # One statement at a time, like a pymysql connection shared by the crawler threads
+        self.open = True
+
+    def cursor(self, cursor_class=None) -> Cursor:
+        # cursor_class (e.g. pymysql.cursors.SSCursor) is accepted and ignored, rows are always fetched at once
+        return Cursor(connection=self)
+
+    def begin(self):
+        with self._lock:
+            self._connection.execute('BEGIN;')
+
+    def commit(self):
+        with self._lock:
+            if self._connection.in_transaction:
+                self._connection.execute('COMMIT;')
+
+    def rollback(self):
+        with self._lock:
+            if self._connection.in_transaction:
+                self._connection.execute('ROLLBACK;')
+
+    def close(self):
+        self._connection.close()
+        self.open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def connect(database: str = ':memory:', **kwargs) -> Connection:
+    # Same call shape as pymysql.connect(), the MySQL connection settings (host, user, password, charset, autocommit) are ignored
+    return Connection(database=database)
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+import pymysql
+from lxml import html
+
+from basler_main_category import DEFAULT_LOCALES, PROJECT_FILES_DIR, ensure_dir_exists, page_checker, page_checker_json
+from crawl_engine import AsyncFetcher
+from crawl_metrics import configure_logging, logger, metrics
+from db_writer import ProductDetailWriter, create_tables
+from http_client import configure_http
+from response_cache import SQLiteResponseCache, configure_cache
+
+
+def product_url_key(product_link: str) -> str:
+    return product_link.rstrip('/').rsplit('/shop/', 1)[-1]
+
+
+def parse_price(value) -> float or None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_product_json(product_link: str, body: bytes) -> dict or None:
+    # Details of the magento item whose url_key matches the product link
+    url_key = product_url_key(product_link=product_link)
+    try:
+        response_dict = json.loads(body)
+    except ValueError:
+        return None  # Not JSON, e.g. an error page served with status 200
+    if not isinstance(response_dict, dict):
+        return None
+    items = response_dict.get('items') or list()
+    item = next((item for item in items if isinstance(item, dict) and item.get('url_key') == url_key), None)
+    if item is None:
+        return None
+    final_price = ((item.get('price_range') or dict()).get('minimum_price') or dict()).get('final_price') or dict()
+    return {'sku': item.get('sku'), 'product_name': item.get('name'), 'price': parse_price(final_price.get('value', item.get('price'))),
+            'currency': final_price.get('currency'), 'availability': item.get('stock_status'), 'details': item}
+
+
+def parse_product_html(product_link: str, page_text: str) -> dict or None:
+    # Details of the schema.org Product in the JSON-LD of the shop page
+    parsed_html = html.fromstring(page_text)
+    for script_text in parsed_html.xpath('//script[@type="application/ld+json"]/text()'):
+        try:
+            json_ld = json.loads(script_text)
+        except ValueError:
+            continue
+        entries = json_ld if isinstance(json_ld, list) else json_ld.get('@graph', [json_ld])
+        for entry in entries:
+            if not isinstance(entry, dict) or entry.get('@type') != 'Product':
+                continue
+            offers = entry.get('offers') or dict()
+            if isinstance(offers, list):
+                offers = offers[0] if offers else dict()
+            availability = offers.get('availability')
+            return {'sku': entry.get('sku'), 'product_name': entry.get('name'), 'price': parse_price(offers.get('price')), 'currency': offers.get('priceCurrency'),
+                    'availability': availability.rsplit('/', 1)[-1] if availability else None, 'details': entry}
+    return None
+
+
+def parse_product(product_link: str, payload_kind: str, payload) -> dict or None:
+    # Entry point of the parse worker processes
+    if payload_kind == 'json':
+        return parse_product_json(product_link=product_link, body=payload)
+    return parse_product_html(product_link=product_link, page_text=payload)
+
+
+class ProductDetailStage:
+    """Second pipeline stage: product links -> cached magento / shop page payloads -> parsed in a process pool -> products table.
+
+    fetch_workers / max_per_host bound the network side, parse_workers (all cores by default) the CPU side,
+    independently of the link discovery crawl.
+    """
+
+    def __init__(self, connection, project_files_dir: str = PROJECT_FILES_DIR, base_url: str = 'https://www.baslerweb.com', fetch_workers: int = 16, max_per_host: int = 8,
+                 parse_workers: int = None, batch_size: int = 200, chunk_size: int = 1000, locales: dict = None):
+        self.connection = connection
+        self.project_files_dir = project_files_dir
+        self.base_url = base_url.rstrip('/')
+        self.fetch_workers = fetch_workers
+        self.max_per_host = max_per_host
+        self.parse_workers = parse_workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        # Products are looked up in the magento store of the locale they were found in
+        self.product_api_templates = {locale: self.base_url + f'/api/magento/products?store={store}&locale={locale}&filters=-FILTERS-'
+                                      for locale, store in dict(locales or DEFAULT_LOCALES).items()}
+
+    def product_api_url(self, product_link: str, locale: str = 'en-us') -> str:
+        filters = json.dumps({'url_key': [product_url_key(product_link=product_link)]}, separators=(',', ':'))
+        return self.product_api_templates[locale].replace('-FILTERS-', quote(filters, safe=':,'))
+
+    def iter_product_chunks(self):
+        # Live product links of the configured locales in id order, chunk_size at a time
+        last_id = 0
+        while True:
+            with self.connection.cursor() as cursor:
+                cursor.execute('SELECT id, product_link, locale FROM products_links WHERE id > %s AND is_deleted = 0 AND locale IN %s ORDER BY id LIMIT %s;',
+                               (last_id, list(self.product_api_templates), self.chunk_size))
+                rows = cursor.fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+
+    async def extract(self, fetcher: AsyncFetcher, parse_pool: ProcessPoolExecutor, product_id: int, product_link: str, locale: str) -> tuple:
+        # Magento API first, the shop page when the API has no matching item
+        loop = asyncio.get_running_loop()
+        body = await fetcher.fetch(page_checker_json, url=self.product_api_url(product_link=product_link, locale=locale), method='GET',
+                                   directory_path=os.path.join(self.project_files_dir, 'Product_Details'), raw=True)
+        if body is not None:
+            with metrics.timer(metric='parse_seconds', stage='product_details_parse'):
+                details = await loop.run_in_executor(parse_pool, parse_product, product_link, 'json', body)
+            if details is not None:
+                return product_id, details
+        page_text = await fetcher.fetch(page_checker, url=product_link, method='GET', directory_path=os.path.join(self.project_files_dir, 'Shop_Pages'))
+        if page_text is None:
+            return product_id, None
+        with metrics.timer(metric='parse_seconds', stage='product_details_parse'):
+            return product_id, await loop.run_in_executor(parse_pool, parse_product, product_link, 'html', page_text)
+
+    async def run_async(self):
+        fetcher = AsyncFetcher(max_per_host=self.max_per_host, max_workers=self.fetch_workers)
+        failed_count = 0
+        try:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as parse_pool, ProductDetailWriter(connection=self.connection, batch_size=self.batch_size) as writer:
+                for products in self.iter_product_chunks():
+                    extract_tasks = [self.extract(fetcher=fetcher, parse_pool=parse_pool, product_id=product_id, product_link=product_link, locale=locale)
+                                     for product_id, product_link, locale in products]
+                    for extract_task in asyncio.as_completed(extract_tasks):
+                        try:
+                            product_id, details = await extract_task
+                        except Exception as e:  # Fetch / parse error of one product, the others go on
+                            logger.warning('Product detail extraction failed: %r', e)
+                            failed_count += 1
+                            continue
+                        if details is None:
+                            failed_count += 1
+                            continue
+                        writer.add(product_id=product_id, details=details)
+            logger.info('Details of %s products extracted, %s without details', writer.rows_written, failed_count)
+        finally:
+            fetcher.close()
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract product details for the links in products_links')
+    parser.add_argument('--fetch-workers', type=int, default=16, help='Threads fetching payloads')
+    parser.add_argument('--max-per-host', type=int, default=8, help='Concurrent requests per host')
+    parser.add_argument('--parse-workers', type=int, default=None, help='Parse processes, all cores by default')
+    parser.add_argument('--batch-size', type=int, default=200, help='Rows per products insert')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Product links read from Database at a time')
+    parser.add_argument('--locales', default='en-us:amer_en', help='Comma separated locale:store pairs whose products are extracted')
+    parser.add_argument('--log-level', default='INFO', help='DEBUG logs every request')
+    parser.add_argument('--metrics-path', default=None, help='Write the end of run metrics to this file')
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json')
+    arguments = parser.parse_args()
+    configure_logging(level=arguments.log_level)
+
+    # Creating a connection to SQL Database
+    connection = pymysql.connect(host='localhost', user='root', database='baslerweb_db', password='actowiz', charset='utf8mb4', autocommit=True)
+    if connection.open:
+        logger.info('Database connection Successful!')
+    else:
+        logger.error('Database connection Un-Successful.')
+    with connection.cursor() as cursor:
+        create_tables(cursor=cursor)
+
+    ensure_dir_exists(dir_path=PROJECT_FILES_DIR)
+    configure_cache(SQLiteResponseCache(db_path=os.path.join(PROJECT_FILES_DIR, 'response_cache.sqlite3')))
+    configure_http(pool_maxsize=arguments.fetch_workers)
+    try:
+        ProductDetailStage(connection=connection, fetch_workers=arguments.fetch_workers, max_per_host=arguments.max_per_host, parse_workers=arguments.parse_workers,
+                           batch_size=arguments.batch_size, chunk_size=arguments.chunk_size,
+                           locales=dict(pair.split(':', 1) for pair in arguments.locales.split(','))).run()
+    finally:
+        metrics.emit(path=arguments.metrics_path, output_format=arguments.metrics_format)
@@ -0,0 +1,264 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from crawl_metrics import logger
+
+try:
+    import zstandard  # Optional, gzip is used for new entries without it
+except ImportError:
+    zstandard = None
+
+
+class ResponseCache:
+    """Interface of the response cache backends used by page_checker / page_checker_json.
+
+    Entries are addressed by (namespace, key): the namespace is the old cache directory name
+    (e.g. 'Product_Pages') and the key is the sha256 of the request.
+    """
+
+    def get(self, namespace: str, key: str) -> dict or None:
+        # Returns {'body', 'content_type', 'fetched_at', 'etag', 'last_modified', 'fresh'} or None when the key was never stored
+        raise NotImplementedError
+
+    def put(self, namespace: str, key: str, url: str, body: bytes, content_type: str = None, etag: str = None, last_modified: str = None):
+        raise NotImplementedError
+
+    def touch(self, namespace: str, key: str):
+        # Marks a stored entry as just fetched, used when the server answers 304 Not Modified
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str):
+        # Drops an entry whose body turned out to be unusable, e.g. an error page served with status 200
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteResponseCache(ResponseCache):
+    """All responses in a single SQLite file, with TTL / size based eviction, a revalidate mode and a replay mode.
+
+    Bodies are content addressed: responses rows point at a blobs row by the sha256 of the body, so identical
+    responses (e.g. unchanged magento pages across runs) are stored once, compressed with zstd when the
+    zstandard package is installed and with gzip otherwise.
+
+    ttl:       seconds after which an entry is no longer fresh (None keeps entries forever)
+    max_bytes: total compressed size above which the oldest entries are evicted (None disables it)
+    revalidate: treat every entry as stale, so it is refetched; the stored copy is only served if the refetch fails
+    replay:    serve every stored entry as it is and never send a request, missing entries are failed requests
+    """
+
+    schema = '''CREATE TABLE IF NOT EXISTS responses (
+                    namespace TEXT NOT NULL,
+                    cache_key TEXT NOT NULL,
+                    url TEXT,
+                    content_type TEXT,
+                    fetched_at REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    body_hash TEXT,
+                    PRIMARY KEY (namespace, cache_key)
+                    );'''
+    blobs_schema = '''CREATE TABLE IF NOT EXISTS blobs (
+                    body_hash TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    data BLOB NOT NULL
+                    );'''
+    fetched_at_index = '''CREATE INDEX IF NOT EXISTS responses_fetched_at ON responses (fetched_at);'''
+    body_hash_index = '''CREATE INDEX IF NOT EXISTS responses_body_hash ON responses (body_hash);'''
+
+    def __init__(self, db_path: str, ttl: float = None, max_bytes: int = None, revalidate: bool = False, replay: bool = False, codec: str = None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self.replay = replay
+        self.codec = codec or ('zstd' if zstandard is not None else 'gzip')
+        if self.codec == 'zstd' and zstandard is None:
+            raise ValueError('The zstd codec needs the zstandard package')
+        self._lock = threading.Lock()  # One connection shared by all fetcher threads
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL;')
+        self._connection.execute('PRAGMA synchronous=NORMAL;')
+        self._connection.execute(self.schema)
+        self._connection.execute(self.blobs_schema)
+        self._connection.execute(self.fetched_at_index)
+        # Caches created by older versions lack the validator columns and kept the raw body in the responses row
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(responses);')]
+        for column in ('etag', 'last_modified', 'body_hash'):
+            if column not in columns:
+                self._connection.execute(f'ALTER TABLE responses ADD COLUMN {column} TEXT;')
+        self._connection.execute(self.body_hash_index)
+        self._total_bytes = self._stored_bytes()
+        if 'body' in columns:
+            self._migrate_inline_bodies()
+        if not replay:
+            self.purge_expired()  # A replay serves the archive as it is, expired entries included
+
+    def _stored_bytes(self) -> int:
+        return self._connection.execute('SELECT COALESCE(SUM(stored_size), 0) FROM blobs;').fetchone()[0]
+
+    def _compress(self, body: bytes) -> bytes:
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=3).compress(body)
+        return gzip.compress(body, compresslevel=6)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError('Cached response is zstd compressed, install the zstandard package to read it')
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _store_blob(self, body: bytes) -> tuple:
+        # Returns (body hash, compressed blob or None when the body is already stored), compression happens outside the lock
+        body_hash = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            exists = self._connection.execute('SELECT 1 FROM blobs WHERE body_hash = ?;', (body_hash,)).fetchone() is not None
+        return body_hash, None if exists else self._compress(body)
+
+    def _insert_blob(self, body_hash: str, data: bytes or None):
+        # Caller holds the lock
+        if data is not None and self._connection.execute('INSERT OR IGNORE INTO blobs (body_hash, codec, stored_size, data) VALUES (?, ?, ?, ?);',
+                                                         (body_hash, self.codec, len(data), sqlite3.Binary(data))).rowcount:
+            self._total_bytes += len(data)
+
+    def _migrate_inline_bodies(self, chunk_size: int = 500):
+        # Moves bodies stored in the responses rows by older versions into the compressed blobs table
+        migrated_count = 0
+        while True:
+            rows = self._connection.execute('SELECT namespace, cache_key, body FROM responses WHERE body IS NOT NULL LIMIT ?;', (chunk_size,)).fetchall()
+            if not rows:
+                break
+            self._connection.execute('BEGIN;')
+            for namespace, key, body in rows:
+                body_hash, data = self._store_blob(body=bytes(body))
+                self._insert_blob(body_hash=body_hash, data=data)
+                self._connection.execute('UPDATE responses SET body_hash = ?, body = NULL WHERE namespace = ? AND cache_key = ?;', (body_hash, namespace, key))
+            self._connection.execute('COMMIT;')
+            migrated_count += len(rows)
+        if migrated_count:
+            logger.info('Compressed %s cached responses into the blob archive', migrated_count)
+
+    def get(self, namespace: str, key: str) -> dict or None:
+        with self._lock:
+            row = self._connection.execute('''SELECT blobs.codec, blobs.data, responses.content_type, responses.fetched_at, responses.etag, responses.last_modified
+                                              FROM responses JOIN blobs ON blobs.body_hash = responses.body_hash
+                                              WHERE responses.namespace = ? AND responses.cache_key = ?;''', (namespace, key)).fetchone()
+        if row is None:
+            return None
+        codec, data, content_type, fetched_at, etag, last_modified = row
+        fresh = self.replay or (not self.revalidate and (self.ttl is None or time.time() - fetched_at <= self.ttl))
+        return {'body': self._decompress(codec=codec, data=data), 'content_type': content_type, 'fetched_at': fetched_at, 'etag': etag, 'last_modified': last_modified, 'fresh': fresh}
+
+    def put(self, namespace: str, key: str, url: str, body: bytes, content_type: str = None, etag: str = None, last_modified: str = None):
+        body_hash, data = self._store_blob(body=body)
+        with self._lock:
+            if data is None and self._connection.execute('SELECT 1 FROM blobs WHERE body_hash = ?;', (body_hash,)).fetchone() is None:
+                data = self._compress(body)  # The shared blob was freed since _store_blob() looked
+            self._insert_blob(body_hash=body_hash, data=data)
+            previous_row = self._connection.execute('SELECT body_hash FROM responses WHERE namespace = ? AND cache_key = ?;', (namespace, key)).fetchone()
+            self._connection.execute('''INSERT OR REPLACE INTO responses (namespace, cache_key, url, content_type, fetched_at, size, etag, last_modified, body_hash)
+                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);''', (namespace, key, url, content_type, time.time(), len(body), etag, last_modified, body_hash))
+            if previous_row is not None and previous_row[0] != body_hash:
+                self._delete_blob_if_orphan(body_hash=previous_row[0])  # A refetched page whose body changed
+            if self.max_bytes is not None and self._total_bytes > self.max_bytes and not self.replay:  # Never shrink an archive being replayed
+                self._evict_oldest(keep_namespace=namespace, keep_key=key)
+
+    def touch(self, namespace: str, key: str):
+        with self._lock:
+            self._connection.execute('UPDATE responses SET fetched_at = ? WHERE namespace = ? AND cache_key = ?;', (time.time(), namespace, key))
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            row = self._connection.execute('SELECT body_hash FROM responses WHERE namespace = ? AND cache_key = ?;', (namespace, key)).fetchone()
+            if row is None:
+                return
+            self._connection.execute('DELETE FROM responses WHERE namespace = ? AND cache_key = ?;', (namespace, key))
+            self._delete_blob_if_orphan(body_hash=row[0])
+
+    def _delete_orphan_blobs(self) -> int:
+        # Blobs no response points at any more (caller holds the lock)
+        deleted = self._connection.execute('DELETE FROM blobs WHERE NOT EXISTS (SELECT 1 FROM responses WHERE responses.body_hash = blobs.body_hash);').rowcount
+        self._total_bytes = self._stored_bytes()
+        return deleted
+
+    def _delete_blob_if_orphan(self, body_hash: str) -> bool:
+        # Deletes a blob once no response points at it any more (caller holds the lock)
+        if self._connection.execute('SELECT 1 FROM responses WHERE body_hash = ? LIMIT 1;', (body_hash,)).fetchone() is not None:
+            return False
+        blob_row = self._connection.execute('SELECT stored_size FROM blobs WHERE body_hash = ?;', (body_hash,)).fetchone()
+        if blob_row is None:
+            return False
+        self._connection.execute('DELETE FROM blobs WHERE body_hash = ?;', (body_hash,))
+        self._total_bytes -= blob_row[0]
+        return True
+
+    def _evict_oldest(self, keep_namespace: str, keep_key: str, batch_size: int = 20):
+        # Deletes the oldest entries one at a time until the cache is back under 90% of max_bytes (caller holds the lock)
+        # A blob shared with newer entries survives, only blobs left without a response count towards the freed bytes
+        target_bytes = int(self.max_bytes * 0.9)
+        freed_count = 0
+        if self._delete_orphan_blobs():  # Blobs left behind by older versions cost no live entry
+            logger.info('Deleted orphaned cached bodies, %s bytes stored', self._total_bytes)
+        while self._total_bytes > target_bytes:
+            oldest_rows = self._connection.execute('''SELECT namespace, cache_key, body_hash FROM responses
+                                                      WHERE NOT (namespace = ? AND cache_key = ?)
+                                                      ORDER BY fetched_at LIMIT ?;''', (keep_namespace, keep_key, batch_size)).fetchall()
+            if not oldest_rows:
+                break  # Only the entry being put is left
+            for namespace, key, body_hash in oldest_rows:
+                self._connection.execute('DELETE FROM responses WHERE namespace = ? AND cache_key = ?;', (namespace, key))
+                freed_count += 1
+                self._delete_blob_if_orphan(body_hash=body_hash)
+                if self._total_bytes <= target_bytes:
+                    break
+        logger.info('Evicted %s cached responses', freed_count)
+
+    def purge_expired(self):
+        if self.ttl is None:
+            return
+        with self._lock:
+            deleted = self._connection.execute('DELETE FROM responses WHERE fetched_at < ?;', (time.time() - self.ttl,)).rowcount
+            if deleted:
+                self._delete_orphan_blobs()
+                logger.info('Purged %s expired cached responses', deleted)
+
+    def stats(self) -> dict:
+        # Number of responses / distinct bodies and their raw / compressed size, shows what deduplication and compression save
+        with self._lock:
+            response_count, raw_bytes = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses;').fetchone()
+            blob_count, stored_bytes = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM blobs;').fetchone()
+        return {'responses': response_count, 'blobs': blob_count, 'raw_bytes': raw_bytes, 'stored_bytes': stored_bytes}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_cache = None
+
+
+def configure_cache(cache: ResponseCache):
+    # Installs the backend used by page_checker / page_checker_json
+    global _cache
+    if _cache is not None and _cache is not cache:
+        _cache.close()
+    _cache = cache
+    return cache
+
+
+def get_cache(directory_path: str) -> ResponseCache:
+    # Returns the configured backend, by default a SQLite cache next to the old per-namespace directories
+    if _cache is None:
+        cache_root = os.path.dirname(directory_path) or '.'
+        os.makedirs(cache_root, exist_ok=True)
+        configure_cache(SQLiteResponseCache(db_path=os.path.join(cache_root, 'response_cache.sqlite3')))
+    return _cache
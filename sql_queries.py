@@ -9,11 +9,174 @@ sub_cat_query = '''CREATE TABLE IF NOT EXISTS sub_categories_links (
                     id INT AUTO_INCREMENT PRIMARY KEY,
                     sub_category_name VARCHAR(255),
                     sub_category_link VARCHAR(255),
-                    link_status VARCHAR(255) DEFAULT 'pending'
+                    link_status VARCHAR(255) DEFAULT 'pending',
+                    main_category_id INT DEFAULT NULL
+                    );'''
+
+# Columns / keys added to sub_categories_links after the first release
+sub_cat_new_columns = {'main_category_id': 'INT DEFAULT NULL'}
+sub_cat_main_fk = 'CONSTRAINT fk_sub_category_main FOREIGN KEY (main_category_id) REFERENCES main_categories_links (id)'
+
+prod_cat_query = '''CREATE TABLE IF NOT EXISTS product_categories_links (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    product_category_name VARCHAR(255),
+                    product_category_link VARCHAR(255) UNIQUE,
+                    sub_category_id INT DEFAULT NULL,
+                    category_id VARCHAR(64) DEFAULT NULL,
+                    KEY product_category_magento_id (category_id),
+                    CONSTRAINT fk_product_category_sub FOREIGN KEY (sub_category_id) REFERENCES sub_categories_links (id)
                     );'''
 
 products_query = '''CREATE TABLE IF NOT EXISTS products_links (
                     id INT AUTO_INCREMENT PRIMARY KEY,
                     product_link VARCHAR(255) UNIQUE,
-                    metadata JSON
-                    );'''
\ No newline at end of file
+                    locale VARCHAR(16) NOT NULL DEFAULT 'en-us',
+                    is_deleted TINYINT(1) NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    KEY products_links_updated_at (updated_at)
+                    );'''
+
+# Columns added to products_links after the first release, added to existing tables on start-up
+products_new_columns = {'is_deleted': 'TINYINT(1) NOT NULL DEFAULT 0',
+                        'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP',
+                        'locale': "VARCHAR(16) NOT NULL DEFAULT 'en-us'"}
+
+category_state_query = '''CREATE TABLE IF NOT EXISTS category_crawl_state (
+                    category_id VARCHAR(64) PRIMARY KEY,
+                    total_count INT,
+                    page_hashes JSON,
+                    product_links JSON,
+                    pending_removals JSON,
+                    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    );'''
+
+# Products gone from a category are saved with its new state until their tombstones are written, so a crash in between loses none
+category_state_new_columns = {'pending_removals': 'JSON'}
+
+# Magento category ids behind every contentful slug of the nav (slug is '<locale>:<slug>'), re-resolved once resolved_at is older than the max age
+category_ids_query = '''CREATE TABLE IF NOT EXISTS category_slug_ids (
+                    slug VARCHAR(255) PRIMARY KEY,
+                    category_ids JSON,
+                    resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );'''
+
+# Product details extracted from the magento API / shop page of every product link
+product_details_query = '''CREATE TABLE IF NOT EXISTS products (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    product_id INT NOT NULL UNIQUE,
+                    sku VARCHAR(255),
+                    product_name VARCHAR(512),
+                    price DECIMAL(12, 2),
+                    currency VARCHAR(8),
+                    availability VARCHAR(255),
+                    details JSON,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    KEY products_sku (sku),
+                    CONSTRAINT fk_products_product_link FOREIGN KEY (product_id) REFERENCES products_links (id)
+                    );'''
+
+product_details_upsert_query = '''INSERT INTO products (product_id, sku, product_name, price, currency, availability, details)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE sku = VALUES(sku), product_name = VALUES(product_name), price = VALUES(price),
+                                            currency = VALUES(currency), availability = VALUES(availability), details = VALUES(details);'''
+
+# Junction between products and the product categories they are listed under (lineage: product category -> sub -> main)
+product_category_products_query = '''CREATE TABLE IF NOT EXISTS product_category_products (
+                    product_category_id INT NOT NULL,
+                    product_id INT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (product_category_id, product_id),
+                    KEY product_category_products_product (product_id),
+                    CONSTRAINT fk_product_category_products_category FOREIGN KEY (product_category_id) REFERENCES product_categories_links (id),
+                    CONSTRAINT fk_product_category_products_product FOREIGN KEY (product_id) REFERENCES products_links (id)
+                    );'''
+
+products_upsert_query = '''INSERT INTO products_links (product_link, locale)
+                    VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE is_deleted = 0;'''
+
+products_ids_query = '''SELECT id, product_link FROM products_links WHERE product_link IN %s;'''
+
+product_category_products_insert_query = '''INSERT IGNORE INTO product_category_products (product_category_id, product_id)
+                    VALUES (%s, %s);'''
+
+products_tombstone_query = '''UPDATE products_links SET is_deleted = 1 WHERE product_link IN %s;'''
+
+category_state_upsert_query = '''INSERT INTO category_crawl_state (category_id, total_count, page_hashes, product_links, pending_removals)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE total_count = VALUES(total_count), page_hashes = VALUES(page_hashes), product_links = VALUES(product_links),
+                    pending_removals = VALUES(pending_removals);'''
+
+category_ids_upsert_query = '''INSERT INTO category_slug_ids (slug, category_ids)
+                    VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE category_ids = VALUES(category_ids), resolved_at = CURRENT_TIMESTAMP;'''
+
+# Crawl frontier: one row per product category (page_no = 0) and one per magento page of its categories (page_no > 0)
+frontier_query = '''CREATE TABLE IF NOT EXISTS crawl_frontier (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    main_category_link VARCHAR(255),
+                    sub_category_link VARCHAR(255),
+                    prod_category_link VARCHAR(255) NOT NULL,
+                    category_id VARCHAR(64) NOT NULL DEFAULT '',
+                    page_no INT NOT NULL DEFAULT 0,
+                    page_size INT NOT NULL DEFAULT 21,
+                    locale VARCHAR(16) NOT NULL DEFAULT 'en-us',
+                    link_status VARCHAR(255) DEFAULT 'pending',
+                    claimed_by VARCHAR(255) DEFAULT NULL,
+                    claimed_at TIMESTAMP NULL DEFAULT NULL,
+                    attempts INT NOT NULL DEFAULT 0,
+                    retry_at TIMESTAMP NULL DEFAULT NULL,
+                    UNIQUE KEY frontier_page (prod_category_link, category_id, page_no),
+                    KEY frontier_status (link_status, page_no)
+                    );'''
+
+# Page rows are only valid for the magento page size they were planned with, locale lets a worker claim only the locales it crawls
+# A failed product category is not claimed again before retry_at, so one transient error does not use up all its attempts
+frontier_new_columns = {'page_size': 'INT NOT NULL DEFAULT 21',
+                        'locale': "VARCHAR(16) NOT NULL DEFAULT 'en-us'",
+                        'retry_at': 'TIMESTAMP NULL DEFAULT NULL'}
+
+# Category tree upserts, COALESCE keeps known names / parents when a row is upserted without them (metadata migration)
+main_cat_upsert_query = '''INSERT INTO main_categories_links (main_category_name, main_category_link)
+                    VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE main_category_name = COALESCE(VALUES(main_category_name), main_category_name);'''
+
+sub_cat_upsert_query = '''INSERT INTO sub_categories_links (sub_category_name, sub_category_link, main_category_id)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE sub_category_name = COALESCE(VALUES(sub_category_name), sub_category_name),
+                                            main_category_id = COALESCE(VALUES(main_category_id), main_category_id);'''
+
+prod_cat_upsert_query = '''INSERT INTO product_categories_links (product_category_name, product_category_link, sub_category_id)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE product_category_name = COALESCE(VALUES(product_category_name), product_category_name),
+                                            sub_category_id = COALESCE(VALUES(sub_category_id), sub_category_id);'''
+
+frontier_seed_query = '''INSERT IGNORE INTO crawl_frontier (main_category_link, sub_category_link, prod_category_link, locale)
+                    VALUES (%s, %s, %s, %s);'''
+
+frontier_pages_query = '''INSERT IGNORE INTO crawl_frontier (main_category_link, sub_category_link, prod_category_link, category_id, page_no, page_size, locale)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s);'''
+
+frontier_claim_query = '''UPDATE crawl_frontier
+                    SET link_status = 'in-progress', claimed_by = %s, claimed_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                    WHERE link_status = 'pending' AND page_no = 0 AND locale IN %s AND (retry_at IS NULL OR retry_at <= CURRENT_TIMESTAMP)
+                    ORDER BY id
+                    LIMIT %s;'''
+
+frontier_claimed_query = '''SELECT id, main_category_link, sub_category_link, prod_category_link, locale FROM crawl_frontier
+                    WHERE claimed_by = %s AND link_status = 'in-progress' AND page_no = 0;'''
+
+frontier_release_expired_query = '''UPDATE crawl_frontier SET link_status = 'pending', claimed_by = NULL
+                    WHERE link_status = 'in-progress' AND claimed_at < CURRENT_TIMESTAMP - INTERVAL %s SECOND;'''
+
+# Parent categories follow the product categories below them: done when all are done, failed when only failed ones are left
+parent_status_case = '''CASE
+                        WHEN NOT EXISTS (SELECT 1 FROM crawl_frontier f WHERE f.{column} = p.{column} AND f.page_no = 0 AND f.link_status <> 'done') THEN 'done'
+                        WHEN NOT EXISTS (SELECT 1 FROM crawl_frontier f WHERE f.{column} = p.{column} AND f.page_no = 0 AND f.link_status IN ('pending', 'in-progress')) THEN 'failed'
+                        WHEN EXISTS (SELECT 1 FROM crawl_frontier f WHERE f.{column} = p.{column} AND f.page_no = 0 AND f.link_status <> 'pending') THEN 'in-progress'
+                        ELSE 'pending'
+                    END'''
+
+main_cat_status_query = f'''UPDATE main_categories_links p SET link_status = {parent_status_case.format(column='main_category_link')};'''
+
+sub_cat_status_query = f'''UPDATE sub_categories_links p SET link_status = {parent_status_case.format(column='sub_category_link')};'''
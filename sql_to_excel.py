@@ -1,16 +1,207 @@
-import pandas as pd
+import argparse
+import csv
+import datetime
+import json
+import os
+
 import pymysql
+import pymysql.cursors
+from pymysql.constants import FIELD_TYPE
+
+INTEGER_FIELD_TYPES = (FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG, FIELD_TYPE.INT24)
+EXCEL_MAX_ROWS = 1048576  # Rows per sheet allowed by xlsx, header included
+
+
+def export_value(value):
+    # Converts values pymysql returns into plain JSON / parquet friendly values
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('UTF-8', errors='backslashreplace')
+    return value
+
+
+class ExcelExportWriter:
+    """Write-only openpyxl workbook: rows are streamed to disk instead of being kept in memory."""
+
+    def __init__(self, output_path: str, columns: list, field_types: list):
+        from openpyxl import Workbook
+        self.output_path = output_path
+        self.columns = columns
+        self.workbook = Workbook(write_only=True)
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self.sheet = self.workbook.create_sheet(title=f'products_links_{len(self.workbook.worksheets) + 1}')
+        self.sheet.append(self.columns)
+        self.sheet_rows = 1
+
+    def write_rows(self, rows: list):
+        for row in rows:
+            if self.sheet_rows >= EXCEL_MAX_ROWS:  # Sheet is full, continue on the next one
+                self._new_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(self.output_path)
+
+
+class CsvExportWriter:
+    def __init__(self, output_path: str, columns: list, field_types: list):
+        self.file = open(output_path, 'w', encoding='UTF-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_rows(self, rows: list):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesExportWriter:
+    def __init__(self, output_path: str, columns: list, field_types: list):
+        self.file = open(output_path, 'w', encoding='UTF-8')
+        self.columns = columns
+
+    def write_rows(self, rows: list):
+        for row in rows:
+            record = {column: export_value(value) for column, value in zip(self.columns, row)}
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetExportWriter:
+    """Each chunk becomes one row group of the parquet file."""
+
+    def __init__(self, output_path: str, columns: list, field_types: list):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.columns = columns
+        self.schema = pyarrow.schema([(column, pyarrow.int64() if field_type in INTEGER_FIELD_TYPES else pyarrow.string())
+                                      for column, field_type in zip(columns, field_types)])
+        self.writer = pyarrow.parquet.ParquetWriter(output_path, self.schema)
+
+    def write_rows(self, rows: list):
+        column_values = [[export_value(row[index]) for row in rows] for index in range(len(self.columns))]
+        self.writer.write_table(self.pyarrow.Table.from_arrays([self.pyarrow.array(values, type=field.type) for values, field in zip(column_values, self.schema)], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+EXPORT_WRITERS = {'xlsx': ExcelExportWriter, 'csv': CsvExportWriter, 'jsonl': JsonLinesExportWriter, 'parquet': ParquetExportWriter}
+
+
+# One row per product and product category it is listed under, with the lineage joined from the category tables
+# The last column (changed_at, not exported) is the latest of the two timestamps the incremental filter looks at
+EXPORT_QUERY = '''SELECT p.id, p.product_link, p.locale, m.main_category_link, s.sub_category_link, pc.product_category_link, pc.category_id, p.is_deleted, p.updated_at,
+                    GREATEST(p.updated_at, COALESCE(pcp.created_at, p.updated_at)) AS changed_at
+                    FROM products_links p
+                    LEFT JOIN product_category_products pcp ON pcp.product_id = p.id
+                    LEFT JOIN product_categories_links pc ON pc.id = pcp.product_category_id
+                    LEFT JOIN sub_categories_links s ON s.id = pc.sub_category_id
+                    LEFT JOIN main_categories_links m ON m.id = s.main_category_id'''
+
+# Product categories under a main / sub / product category link, the products are then found through the junction primary key
+CATEGORY_FILTER = '''pcp.product_category_id IN (
+                        SELECT fpc.id FROM product_categories_links fpc
+                        LEFT JOIN sub_categories_links fs ON fs.id = fpc.sub_category_id
+                        LEFT JOIN main_categories_links fm ON fm.id = fs.main_category_id
+                        WHERE fpc.product_category_link LIKE %s OR fs.sub_category_link LIKE %s OR fm.main_category_link LIKE %s)'''
+
+
+def build_export_query(category: str = None, since: str = None, locales: list = None) -> tuple:
+    # category: link (or LIKE pattern with %) of a main / sub / product category
+    conditions = list()
+    args = list()
+    if locales:
+        conditions.append('p.locale IN %s')
+        args.append(list(locales))
+    if category is not None:
+        conditions.append(CATEGORY_FILTER)
+        args.extend([category] * 3)
+    if since is not None:
+        # >= so rows updated in the same second as the last export are not missed
+        conditions.append('(p.updated_at >= %s OR pcp.created_at >= %s)')
+        args.extend([since] * 2)
+    query = EXPORT_QUERY
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    return query + ' ORDER BY p.id;', tuple(args)
+
+
+def load_export_state(state_path: str) -> dict:
+    if not os.path.exists(state_path):
+        return dict()
+    with open(state_path, 'r', encoding='UTF-8') as file:
+        return json.load(file)
+
+
+def save_export_state(state_path: str, state: dict):
+    with open(state_path, 'w', encoding='UTF-8') as file:
+        json.dump(state, file, indent=4)
+
+
+def advance_watermark(watermark, values):
+    # Latest of the watermark and the non-NULL values of a chunk, a chunk of only NULLs leaves the watermark as it is
+    values = [value for value in values if value is not None]
+    if watermark is not None:
+        values.append(watermark)
+    return max(values) if values else None
+
+
+def export_products(connection, output_path: str, export_format: str = 'xlsx', chunk_size: int = 10000, category: str = None, since: str = None, locales: list = None) -> tuple:
+    # Streams products_links through a server-side cursor into the output file, one chunk at a time
+    query, args = build_export_query(category=category, since=since, locales=locales)
+    row_count = 0
+    last_updated_at = None
+    with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(query, args)
+        columns = [description[0] for description in cursor.description][:-1]  # Without changed_at
+        field_types = [description[1] for description in cursor.description][:-1]
+        writer = EXPORT_WRITERS[export_format](output_path=output_path, columns=columns, field_types=field_types)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.write_rows(rows=[row[:-1] for row in rows])
+                row_count += len(rows)
+                # The watermark covers new junction rows too, so a row matched only through pcp.created_at is not exported again next time
+                last_updated_at = advance_watermark(watermark=last_updated_at, values=[row[-1] for row in rows])
+                print(f'Exported {row_count} rows')
+        finally:
+            writer.close()
+    return row_count, last_updated_at
 
-# Creating a connection to SQL Database
-connection = pymysql.connect(host='localhost', user='root', database='baslerweb_db', password='actowiz', charset='utf8mb4', autocommit=True)
-if connection.open:
-    print('Database connection Successful!')
-else:
-    print('Database connection Un-Successful.')
-cursor = connection.cursor()  # Creating a cursor to execute SQL Queries
 
-query = '''SELECT * FROM products_links;'''  # Query that will retrieve all data from Database table
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the products_links table')
+    parser.add_argument('--format', dest='export_format', choices=sorted(EXPORT_WRITERS), default='xlsx')
+    parser.add_argument('--output', default=None, help='Output file, basler_web_product_links.<format> by default')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows fetched from the server-side cursor at a time')
+    parser.add_argument('--category', default=None, help='Only products under this main / sub / product category link (LIKE wildcards allowed)')
+    parser.add_argument('--locale', dest='locales', action='append', default=None, help='Only products of this locale, can be given several times')
+    parser.add_argument('--since-last-export', action='store_true', help='Only rows changed since the previous incremental export to the same output')
+    arguments = parser.parse_args()
+    output_path = arguments.output or f'basler_web_product_links.{arguments.export_format}'
+    state_path = f'{output_path}.export_state.json'
 
-data_frame = pd.read_sql(sql=query, con=connection)  # Reading Data from Database table and converting into DataFrame
+    # Creating a connection to SQL Database
+    connection = pymysql.connect(host='localhost', user='root', database='baslerweb_db', password='actowiz', charset='utf8mb4', autocommit=True)
+    if connection.open:
+        print('Database connection Successful!')
+    else:
+        print('Database connection Un-Successful.')
 
-data_frame.to_excel('basler_web_product_links.xlsx')  # Converting DataFrame into Excel file
+    since = load_export_state(state_path=state_path).get('last_updated_at') if arguments.since_last_export else None
+    exported_count, exported_until = export_products(connection=connection, output_path=output_path, export_format=arguments.export_format, chunk_size=arguments.chunk_size,
+                                                     category=arguments.category, since=since, locales=arguments.locales)
+    if arguments.since_last_export and exported_until is not None:
+        save_export_state(state_path=state_path, state={'last_updated_at': export_value(exported_until)})
+    print(f'{exported_count} rows written to {output_path}')
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # The crawler modules live in the repository root
+
+import mysql_stand_in
+from db_writer import create_tables
+
+
+@pytest.fixture
+def connection():
+    # Crawler tables in an in-memory SQLite stand-in of the MySQL database
+    connection = mysql_stand_in.connect()
+    with connection.cursor() as cursor:
+        create_tables(cursor=cursor)
+    yield connection
+    connection.close()
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from basler_main_category import page_checker_json
+from response_cache import SQLiteResponseCache, configure_cache
+
+
+@pytest.fixture
+def server():
+    # Answers the first request with an HTML maintenance page (status 200), the later ones with JSON
+    bodies = [b'<html>Down for maintenance</html>']
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = bodies.pop(0) if bodies else b'{"items": [], "total_count": 0}'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            server.requests += 1
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = 0
+    server.bodies = bodies
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_non_json_body_is_not_cached(server, tmp_path):
+    cache = configure_cache(SQLiteResponseCache(db_path=str(tmp_path / 'response_cache.sqlite3'), codec='gzip'))
+    url = f'http://127.0.0.1:{server.server_address[1]}/api/contentful?slug=products/cameras'
+    directory_path = str(tmp_path / 'Category_id_jsons')
+    assert page_checker_json(url=url, method='GET', directory_path=directory_path) is None
+    assert cache.stats()['responses'] == 0
+    assert page_checker_json(url=url, method='GET', directory_path=directory_path) == {'items': [], 'total_count': 0}
+    assert page_checker_json(url=url, method='GET', directory_path=directory_path) == {'items': [], 'total_count': 0}
+    assert server.requests == 2  # The JSON answer is cached
+    cache.close()
+
+
+def test_stored_non_json_body_is_fetched_again(server, tmp_path):
+    cache = configure_cache(SQLiteResponseCache(db_path=str(tmp_path / 'response_cache.sqlite3'), codec='gzip'))
+    url = f'http://127.0.0.1:{server.server_address[1]}/api/contentful?slug=products/cameras'
+    directory_path = str(tmp_path / 'Category_id_jsons')
+    page_hash = hashlib.sha256((url + json.dumps(None, sort_keys=True)).encode('UTF-8')).hexdigest()  # Cache key of page_checker_json
+    cache.put(namespace='Category_id_jsons', key=page_hash, url=url, body=b'<html>Stored by an older version</html>')
+    server.bodies.clear()
+    assert page_checker_json(url=url, method='GET', directory_path=directory_path) == {'items': [], 'total_count': 0}
+    assert server.requests == 1
+    assert cache.get(namespace='Category_id_jsons', key=page_hash)['body'] == b'{"items": [], "total_count": 0}'
+    cache.close()
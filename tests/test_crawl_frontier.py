@@ -0,0 +1,106 @@
+from category_tree import CategoryTree
+from crawl_frontier import CrawlFrontier
+
+MAIN = 'https://www.baslerweb.com/en-us/products/cameras/'
+SUB = 'https://www.baslerweb.com/en-us/products/cameras/area-scan-cameras/'
+
+
+def prod_categories(count: int = 3) -> list:
+    return [{'main_cat_link': MAIN, 'sub_cat_link': SUB, 'prod_cat_link': f'{SUB}series-{index}/', 'prod_cat_name': f'Series {index}', 'locale': 'en-us'}
+            for index in range(count)]
+
+
+def seeded_frontier(connection, worker_id: str = 'worker-1', **kwargs) -> CrawlFrontier:
+    categories = prod_categories()
+    CategoryTree(connection=connection).store(main_categories=[('Cameras', MAIN)], sub_categories=[('Area Scan Cameras', SUB, MAIN)],
+                                              prod_categories=[(category['prod_cat_name'], category['prod_cat_link'], SUB) for category in categories])
+    frontier = CrawlFrontier(connection=connection, worker_id=worker_id, **kwargs)
+    frontier.seed(prod_categories=categories)
+    return frontier
+
+
+def statuses(connection) -> dict:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT prod_category_link, link_status FROM crawl_frontier WHERE page_no = 0;')
+        return dict(cursor.fetchall())
+
+
+def parent_statuses(connection) -> tuple:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT link_status FROM main_categories_links;')
+        main_status = cursor.fetchone()[0]
+        cursor.execute('SELECT link_status FROM sub_categories_links;')
+        return main_status, cursor.fetchone()[0]
+
+
+def expire_retry_wait(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE crawl_frontier SET retry_at = NULL;')
+
+
+def test_claim_takes_each_category_once(connection):
+    frontier = seeded_frontier(connection=connection)
+    assert len(frontier.claim(batch_size=2)) == 2
+    assert len(frontier.claim(batch_size=2)) == 3  # The claimed query returns every category this worker holds
+    assert CrawlFrontier(connection=connection, worker_id='worker-2').claim(batch_size=5) == list()
+    assert set(statuses(connection=connection).values()) == {'in-progress'}
+
+
+def test_finished_categories_finish_their_parents(connection):
+    frontier = seeded_frontier(connection=connection)
+    for prod_category in frontier.claim(batch_size=5):
+        frontier.finish(prod_category=prod_category)
+    frontier.update_parents()
+    assert set(statuses(connection=connection).values()) == {'done'}
+    assert parent_statuses(connection=connection) == ('done', 'done')
+
+
+def test_failed_category_waits_before_it_is_retried(connection):
+    frontier = seeded_frontier(connection=connection, max_attempts=2)
+    claimed = frontier.claim(batch_size=1)
+    frontier.fail(prod_category=claimed[0])
+    assert statuses(connection=connection)[claimed[0]['prod_cat_link']] == 'pending'
+    assert claimed[0]['frontier_id'] not in [prod_category['frontier_id'] for prod_category in frontier.claim(batch_size=5)]
+    assert frontier.next_retry_seconds() > 0
+
+    expire_retry_wait(connection=connection)
+    retried = [prod_category for prod_category in frontier.claim(batch_size=5) if prod_category['frontier_id'] == claimed[0]['frontier_id']]
+    frontier.fail(prod_category=retried[0])
+    assert statuses(connection=connection)[claimed[0]['prod_cat_link']] == 'failed'
+    assert frontier.next_retry_seconds() is None
+
+
+def test_only_failed_categories_left_fail_the_parents(connection):
+    frontier = seeded_frontier(connection=connection, max_attempts=1)
+    claimed = frontier.claim(batch_size=5)
+    frontier.fail(prod_category=claimed[0])
+    for prod_category in claimed[1:]:
+        frontier.finish(prod_category=prod_category)
+    frontier.update_parents()
+    assert parent_statuses(connection=connection) == ('failed', 'failed')
+
+
+def test_expired_lease_returns_to_pending(connection):
+    frontier = seeded_frontier(connection=connection, lease_seconds=60)
+    frontier.claim(batch_size=5)
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE crawl_frontier SET claimed_at = datetime(CURRENT_TIMESTAMP, '-120 seconds');")
+    assert len(CrawlFrontier(connection=connection, worker_id='worker-2', lease_seconds=60).claim(batch_size=5)) == 3
+
+
+def test_restarted_worker_resumes_its_own_claims(connection):
+    frontier = seeded_frontier(connection=connection)
+    claimed = frontier.claim(batch_size=3)
+    frontier.finish(prod_category=claimed[0])
+    restarted = CrawlFrontier(connection=connection, worker_id='worker-1')
+    restarted.seed(prod_categories=prod_categories())
+    assert sorted(statuses(connection=connection).values()) == ['done', 'pending', 'pending']
+
+
+def test_finished_crawl_starts_over(connection):
+    frontier = seeded_frontier(connection=connection)
+    for prod_category in frontier.claim(batch_size=5):
+        frontier.finish(prod_category=prod_category)
+    frontier.seed(prod_categories=prod_categories(count=4))  # A new nav entry alone does not make it a resumed crawl
+    assert set(statuses(connection=connection).values()) == {'pending'}
+    assert len(statuses(connection=connection)) == 4
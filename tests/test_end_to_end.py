@@ -0,0 +1,73 @@
+import socket
+
+import pytest
+
+from basler_main_category import Scraper
+from basler_simulator import SimulatorProcess
+
+CATALOG = {'main_categories': 2, 'sub_categories': 2, 'product_categories': 3, 'products_per_category': 40, 'max_page_size': 25}
+
+
+@pytest.fixture
+def port() -> int:
+    # One port for every simulator of a test, so product links stay the same from one simulator process to the next
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def scrape(connection, project_files_dir, catalog_options: dict, port: int, **scraper_options) -> dict:
+    with SimulatorProcess(catalog_options=catalog_options, port=port) as simulator:
+        Scraper(base_url=simulator.base_url, connection=connection, project_files_dir=str(project_files_dir), log_level='WARNING', **scraper_options).scrape()
+        return simulator.stats()
+
+
+def count(connection, query: str) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        return cursor.fetchone()[0]
+
+
+def test_scrape_stores_every_product(connection, tmp_path, port):
+    stats = scrape(connection=connection, project_files_dir=tmp_path, catalog_options=CATALOG, port=port, max_page_size=100)
+    assert count(connection, 'SELECT COUNT(*) FROM products_links WHERE is_deleted = 0;') == stats['total_products']
+    assert count(connection, "SELECT COUNT(*) FROM crawl_frontier WHERE page_no = 0 AND link_status <> 'done';") == 0
+    assert count(connection, "SELECT COUNT(*) FROM main_categories_links WHERE link_status <> 'done';") == 0
+    # Every product is linked to the product category it was listed under
+    assert count(connection, 'SELECT COUNT(DISTINCT product_id) FROM product_category_products;') == stats['total_products']
+    # The server caps pages at 25: the first page shows the cap and the other pages are requested at that size
+    assert count(connection, 'SELECT COUNT(*) FROM crawl_frontier WHERE page_no > 0 AND page_size <> 25;') == 0
+
+
+def test_scrape_of_several_locales(connection, tmp_path, port):
+    stats = scrape(connection=connection, project_files_dir=tmp_path, catalog_options=CATALOG, port=port, locales={'en-us': 'amer_en', 'de-de': 'emea_de'})
+    assert count(connection, 'SELECT COUNT(*) FROM products_links WHERE is_deleted = 0;') == 2 * stats['total_products']
+    assert count(connection, "SELECT COUNT(*) FROM products_links WHERE locale = 'de-de';") == stats['total_products']
+    assert count(connection, 'SELECT COUNT(*) FROM category_crawl_state;') == 2 * count(connection, "SELECT COUNT(*) FROM crawl_frontier WHERE page_no = 0 AND locale = 'en-us';")
+
+
+def test_incremental_scrape_tombstones_removed_products(connection, tmp_path, port):
+    first_stats = scrape(connection=connection, project_files_dir=tmp_path, catalog_options=CATALOG, port=port)
+    # Another seed gives every category another size: larger ones gain products, smaller ones lose the last ones
+    second_stats = scrape(connection=connection, project_files_dir=tmp_path, catalog_options=dict(CATALOG, seed=1), port=port, incremental=True)
+    assert count(connection, 'SELECT COUNT(*) FROM products_links WHERE is_deleted = 0;') == second_stats['total_products']
+    total_count = count(connection, 'SELECT COUNT(*) FROM products_links;')
+    assert total_count >= max(first_stats['total_products'], second_stats['total_products'])
+    assert count(connection, 'SELECT COUNT(*) FROM products_links WHERE is_deleted = 1;') == total_count - second_stats['total_products']
+
+
+def test_unchanged_incremental_scrape_keeps_every_product(connection, tmp_path, port):
+    scrape(connection=connection, project_files_dir=tmp_path, catalog_options=CATALOG, port=port)
+    stats = scrape(connection=connection, project_files_dir=tmp_path, catalog_options=CATALOG, port=port, incremental=True)
+    assert count(connection, 'SELECT COUNT(*) FROM products_links WHERE is_deleted = 0;') == stats['total_products']
+    assert count(connection, 'SELECT COUNT(*) FROM products_links WHERE is_deleted = 1;') == 0
+
+
+def test_replay_needs_no_server(connection, tmp_path, port):
+    stats = scrape(connection=connection, project_files_dir=tmp_path, catalog_options=CATALOG, port=port)
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM product_category_products;')
+        cursor.execute('DELETE FROM products_links;')
+    # Same urls as the archived crawl, but nothing listens on the port any more
+    Scraper(base_url=f'http://127.0.0.1:{port}', connection=connection, project_files_dir=str(tmp_path), replay=True, resume=False, log_level='WARNING').scrape()
+    assert count(connection, 'SELECT COUNT(*) FROM products_links WHERE is_deleted = 0;') == stats['total_products']
@@ -0,0 +1,47 @@
+from basler_main_category import DEFAULT_PAGE_SIZE, MAGENTO_PAGE_SIZE_FILTER, category_slug, link_slug_words, magento_page_url, pagination_problem
+
+TEMPLATE = ('https://www.baslerweb.com/api/magento/products?store=amer_en&locale=en-us&filters=%7B%22sort_dir%22:%5B%22asc%22%5D,%22page%22:%5B%22-PAGE_NO-%22%5D'
+            + MAGENTO_PAGE_SIZE_FILTER + ',%22category_id%22:%5B%22-C_I_D-%22%5D%7D')
+
+
+def listing(total_count: int, page_size: int) -> list:
+    return [{'total_count': total_count, 'items': [{'url_key': f'product-{index}'} for index in range(start, min(start + page_size, total_count))]}
+            for start in range(0, total_count, page_size)]
+
+
+def test_consistent_pages_have_no_problem():
+    assert pagination_problem(pages=listing(total_count=50, page_size=21), total_count=50, page_size=21) is None
+
+
+def test_failed_pages_are_left_to_the_frontier():
+    pages = listing(total_count=50, page_size=21)
+    pages[1] = None
+    assert pagination_problem(pages=pages, total_count=50, page_size=21) is None
+
+
+def test_changed_total_count_is_a_problem():
+    pages = listing(total_count=50, page_size=21)
+    pages[2]['total_count'] = 49
+    assert 'total_count changed from 50 to 49 on page 3' == pagination_problem(pages=pages, total_count=50, page_size=21)
+
+
+def test_short_page_is_a_problem():
+    pages = listing(total_count=50, page_size=21)
+    pages[1]['items'].pop()
+    assert 'page 2 has 20 items instead of 21' == pagination_problem(pages=pages, total_count=50, page_size=21)
+
+
+def test_category_slug_of_both_link_shapes():
+    assert category_slug(prod_cat_link='https://www.baslerweb.com/en-us/products/cameras/area-scan-cameras/') == 'products/cameras/area-scan-cameras'
+    assert category_slug(prod_cat_link='https://www.baslerweb.com/de-de/products/cameras/#products', locale='de-de') == 'products/cameras'
+    assert category_slug(prod_cat_link='https://www.baslerweb.com/en-us/products/cameras/?series=ace#products') == 'products/cameras&series=ace'
+
+
+def test_link_slug_words_ignore_the_locale_path():
+    assert link_slug_words(link='https://www.baslerweb.com/ja-jp/products/kits-and-bundles/') == {'kits', 'and', 'bundles'}
+
+
+def test_default_page_size_keeps_the_original_url():
+    original = TEMPLATE.replace(MAGENTO_PAGE_SIZE_FILTER, '').replace('-PAGE_NO-', '2').replace('-C_I_D-', '123')
+    assert magento_page_url(template=TEMPLATE, category_id='123', page_no=2, page_size=DEFAULT_PAGE_SIZE) == original
+    assert '%22page_size%22:%5B%22100%22%5D' in magento_page_url(template=TEMPLATE, category_id='123', page_no=2, page_size=100)
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from response_cache import SQLiteResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SQLiteResponseCache(db_path=str(tmp_path / 'response_cache.sqlite3'), codec='gzip')
+    yield cache
+    cache.close()
+
+
+def test_put_and_get(cache):
+    cache.put(namespace='Product_Pages', key='a', url='https://example.com/a', body=b'{"items": []}', etag='"v1"')
+    entry = cache.get(namespace='Product_Pages', key='a')
+    assert entry['body'] == b'{"items": []}'
+    assert entry['etag'] == '"v1"'
+    assert entry['fresh']
+    assert cache.get(namespace='Product_Pages', key='b') is None
+
+
+def test_identical_bodies_share_one_blob(cache):
+    for key in ('a', 'b', 'c'):
+        cache.put(namespace='Product_Pages', key=key, url=f'https://example.com/{key}', body=b'same body')
+    assert cache.stats()['responses'] == 3
+    assert cache.stats()['blobs'] == 1
+
+
+def test_replaced_body_frees_its_blob(cache):
+    for version in range(5):
+        cache.put(namespace='Product_Pages', key='a', url='https://example.com/a', body=f'body {version}'.encode())
+    assert cache.stats()['blobs'] == 1
+    assert cache._total_bytes == cache.stats()['stored_bytes']
+
+
+def test_delete_frees_the_blob(cache):
+    cache.put(namespace='Product_Pages', key='a', url='https://example.com/a', body=b'<html>maintenance</html>')
+    cache.delete(namespace='Product_Pages', key='a')
+    assert cache.get(namespace='Product_Pages', key='a') is None
+    assert cache.stats()['blobs'] == 0
+
+
+def test_eviction_keeps_the_newest_entries(tmp_path):
+    cache = SQLiteResponseCache(db_path=str(tmp_path / 'response_cache.sqlite3'), max_bytes=20000, codec='gzip')
+    for index in range(50):
+        cache.put(namespace='Product_Pages', key=f'key-{index}', url=f'https://example.com/{index}', body=os.urandom(1000))
+    stats = cache.stats()
+    assert 0 < stats['stored_bytes'] <= 20000
+    assert stats['responses'] > 10  # Only as many entries as needed are evicted
+    assert cache.get(namespace='Product_Pages', key='key-49') is not None
+    assert cache.get(namespace='Product_Pages', key='key-0') is None
+    cache.close()
+
+
+def test_eviction_never_drops_the_entry_being_put(tmp_path):
+    cache = SQLiteResponseCache(db_path=str(tmp_path / 'response_cache.sqlite3'), max_bytes=5000, codec='gzip')
+    cache.put(namespace='Product_Pages', key='small', url='https://example.com/small', body=os.urandom(1000))
+    cache.put(namespace='Product_Pages', key='large', url='https://example.com/large', body=os.urandom(10000))
+    assert cache.get(namespace='Product_Pages', key='large') is not None
+    assert cache.get(namespace='Product_Pages', key='small') is None
+    cache.close()
+
+
+def test_replay_serves_stale_entries_and_never_evicts(tmp_path):
+    db_path = str(tmp_path / 'response_cache.sqlite3')
+    cache = SQLiteResponseCache(db_path=db_path, codec='gzip')
+    cache.put(namespace='Product_Pages', key='a', url='https://example.com/a', body=os.urandom(1000))
+    cache.close()
+    replay_cache = SQLiteResponseCache(db_path=db_path, ttl=0, max_bytes=10, replay=True, codec='gzip')
+    replay_cache.put(namespace='Product_Pages', key='b', url='https://example.com/b', body=os.urandom(1000))
+    assert replay_cache.get(namespace='Product_Pages', key='a')['fresh']
+    assert replay_cache.stats()['responses'] == 2
+    replay_cache.close()